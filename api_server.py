@@ -0,0 +1,119 @@
+# api_server.py - Servicio HTTP JSON sobre el chatbot (alternativa a Streamlit)
+import argparse
+import contextlib
+import json
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from rag_chatbot import RAGChatbot
+from health import run_probes, READINESS_PROBES
+
+# Un único chatbot por proceso worker, compartido por todas las peticiones
+chatbot = None
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global chatbot
+    chatbot = RAGChatbot()
+    if not chatbot.setup_retrieval_chain():
+        raise RuntimeError("No se pudo configurar la cadena RAG")
+    yield
+
+async def read_json(request: Request) -> dict:
+    """Lee el cuerpo JSON de la petición (vacío si no es válido)"""
+    try:
+        body = await request.json()
+        return body if isinstance(body, dict) else {}
+    except ValueError:
+        return {}
+
+def user_id_for(request: Request) -> str:
+    """Usuario para el reparto equitativo del LLM: cabecera X-User-Id o IP del cliente"""
+    return request.headers.get("x-user-id") or (request.client.host if request.client else "anonimo")
+
+async def health(request: Request):
+    return JSONResponse({"status": "ok"})
+
+async def ready(request: Request):
+    # Sin llamadas al LLM: apto para sondas frecuentes del balanceador
+    report = await run_in_threadpool(run_probes, READINESS_PROBES)
+    return JSONResponse(report, status_code=200 if report["status"] == "ok" else 503)
+
+async def stats(request: Request):
+    return JSONResponse(await run_in_threadpool(chatbot.get_system_stats))
+
+async def chat(request: Request):
+    body = await read_json(request)
+    question = body.get("question")
+    if not isinstance(question, str):
+        return JSONResponse({"error": "Falta el campo 'question'"}, status_code=400)
+
+    result = await run_in_threadpool(chatbot.chat, question, user_id_for(request))
+    return JSONResponse(result, status_code=200 if result["success"] else 502)
+
+async def chat_stream(request: Request):
+    body = await read_json(request)
+    question = body.get("question")
+    if not isinstance(question, str):
+        return JSONResponse({"error": "Falta el campo 'question'"}, status_code=400)
+
+    user_id = user_id_for(request)
+
+    # NDJSON: un evento por línea ({"type": "token" | "sources" | "error", ...})
+    def events():
+        for event in chatbot.stream_chat(question, user_id):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+async def search(request: Request):
+    body = await read_json(request)
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        return JSONResponse({"error": "Falta el campo 'query'"}, status_code=400)
+
+    try:
+        k = min(int(body.get("k", 4)), 20)
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "'k' debe ser un entero"}, status_code=400)
+
+    documents = await run_in_threadpool(chatbot.vector_manager.search_similar_documents, query, k)
+
+    return JSONResponse({
+        "results": [
+            {
+                "filename": doc.metadata.get("source", "Documento desconocido"),
+                "chunk_id": doc.metadata.get("chunk_id", 0),
+                "content": doc.page_content
+            }
+            for doc in documents
+        ]
+    })
+
+app = Starlette(
+    routes=[
+        Route("/health", health, methods=["GET"]),
+        Route("/ready", ready, methods=["GET"]),
+        Route("/stats", stats, methods=["GET"]),
+        Route("/chat", chat, methods=["POST"]),
+        Route("/chat/stream", chat_stream, methods=["POST"]),
+        Route("/search", search, methods=["POST"]),
+    ],
+    lifespan=lifespan
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio HTTP del chatbot ILAR")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2, help="Procesos worker (cada uno con su chatbot)")
+    args = parser.parse_args()
+
+    print(f"🚀 Servicio HTTP en http://{args.host}:{args.port} ({args.workers} workers)")
+    uvicorn.run("api_server:app", host=args.host, port=args.port, workers=args.workers)
+
+if __name__ == "__main__":
+    main()
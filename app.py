@@ -2,13 +2,22 @@
 import streamlit as st
 import os
 from config import Config
+from snapshot import load_snapshot
+from profiling import get_profiler, deep_size
+import json
+import tracemalloc
 import time
 import warnings
 import base64
+import uuid
 from pathlib import Path
 
 warnings.filterwarnings("ignore", message="No secrets files found")
 
+# Historial: los últimos mensajes se muestran completos, los anteriores paginados y plegados
+HISTORY_RECENT_MESSAGES = 6
+HISTORY_PAGE_SIZE = 10
+
 # Configuración de la página
 st.set_page_config(
     page_title="🤖 ILAR Chatbot",
@@ -76,19 +85,48 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+def format_size(size_bytes):
+    """Formatea un tamaño en bytes de forma legible"""
+    if size_bytes < 1024:
+        return f"{size_bytes} B"
+    elif size_bytes < 1024**2:
+        return f"{size_bytes/1024:.1f} KB"
+    else:
+        return f"{size_bytes/(1024**2):.1f} MB"
+
 def get_file_size(file_path):
     """Obtiene el tamaño del archivo en formato legible"""
     try:
-        size_bytes = os.path.getsize(file_path)
-        if size_bytes < 1024:
-            return f"{size_bytes} B"
-        elif size_bytes < 1024**2:
-            return f"{size_bytes/1024:.1f} KB"
-        else:
-            return f"{size_bytes/(1024**2):.1f} MB"
+        return format_size(os.path.getsize(file_path))
     except:
         return "Tamaño desconocido"
 
+@st.cache_resource(show_spinner=False)
+def load_ingest_snapshot(snapshot_path, modified_time):
+    """Carga el snapshot de la ingesta una vez por proceso y versión del archivo"""
+    return load_snapshot(snapshot_path)
+
+def get_snapshot():
+    """Snapshot de la última ingesta (None si no existe: se usa la consulta directa)"""
+    snapshot_path = Config.SNAPSHOT_PATH
+    try:
+        modified_time = os.path.getmtime(snapshot_path)
+    except OSError:
+        return None
+    
+    snapshot = load_ingest_snapshot(snapshot_path, modified_time)
+    # Un snapshot de otro índice (cambio de nombre o migración de dimensiones) no sirve
+    if snapshot is None or snapshot.get("index_name") != Config.INDEX_NAME or \
+            snapshot.get("embedding_dimensions") != Config.EMBEDDING_DIMENSIONS:
+        return None
+    return snapshot
+
+@st.cache_data(show_spinner=False)
+def load_pdf_bytes(file_path, modified_time):
+    """Lee un PDF una sola vez por versión del archivo (modified_time invalida la caché)"""
+    with open(file_path, "rb") as f:
+        return f.read()
+
 def create_pdf_button_for_source(file_path, filename, unique_key):
     """Crea un botón de descarga para el PDF en las fuentes"""
     try:
@@ -99,9 +137,8 @@ def create_pdf_button_for_source(file_path, filename, unique_key):
         button_container = st.container()
         
         with button_container:
-            # Leer el archivo PDF
-            with open(file_path, "rb") as f:
-                pdf_data = f.read()
+            # Leer el archivo PDF (desde la caché)
+            pdf_data = load_pdf_bytes(file_path, os.path.getmtime(file_path))
             
             # Crear botón de descarga
             download_button = st.download_button(
@@ -165,6 +202,12 @@ def check_configuration():
 
 def check_system_ready():
     """Verifica si el sistema está listo para usar"""
+    # Con snapshot no hace falta consultar el índice en cada ejecución
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        num_vectors = snapshot["index_stats"].get('total_vectors', 0)
+        return num_vectors > 0, num_vectors
+    
     try:
         from vector_store import VectorStoreManager
         vector_manager = VectorStoreManager()
@@ -182,9 +225,13 @@ def initialize_chatbot():
     if "chatbot" not in st.session_state or st.session_state.chatbot is None:
         try:
             from rag_chatbot import RAGChatbot
+            memory_before = tracemalloc.get_traced_memory()[0]
             chatbot = RAGChatbot()
             if chatbot.setup_retrieval_chain():
                 st.session_state.chatbot = chatbot
+                # Memoria asignada en todo el proceso mientras se creaba el chatbot (solo con el perfilado
+                # activo): es aproximada, incluye lo que otras sesiones asignaron a la vez
+                st.session_state.chatbot_memory = tracemalloc.get_traced_memory()[0] - memory_before
                 return True
             else:
                 return False
@@ -193,8 +240,23 @@ def initialize_chatbot():
             return False
     return True
 
+def record_session_memory():
+    """Registra la memoria de esta sesión (chatbot e historial) en el perfilador"""
+    # Recorrer el historial cuesta O(mensajes): solo se hace con el perfilado activo
+    if not get_profiler().enabled:
+        return
+    get_profiler().record_session(
+        st.session_state.session_id,
+        chatbot=st.session_state.get("chatbot_memory", 0),
+        messages=deep_size(st.session_state.messages)
+    )
+
 def get_available_pdfs():
     """Obtiene la lista de PDFs disponibles con sus rutas"""
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return {doc["filename"]: doc["file_path"] for doc in snapshot["documents"]}
+    
     try:
         config = Config()
         documents_folder = config.DOCUMENTS_FOLDER
@@ -218,6 +280,9 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "chatbot" not in st.session_state:
     st.session_state.chatbot = None
+if "session_id" not in st.session_state:
+    # Identifica la sesión para repartir equitativamente las llamadas al LLM
+    st.session_state.session_id = str(uuid.uuid4())
 
 def display_source_with_file_info(source, available_pdfs, message_index, source_index):
     """Muestra una fuente con botón de descarga del PDF"""
@@ -237,6 +302,48 @@ def display_source_with_file_info(source, available_pdfs, message_index, source_
     else:
         st.markdown(f'<span style="color: #6c757d; font-size: 0.8rem;">📄 {filename} - ❌ Archivo no encontrado</span>', unsafe_allow_html=True)
 
+def render_message(message, message_index, available_pdfs, compact=False):
+    """Muestra un mensaje del historial; en modo compacto las fuentes van sin botones de descarga"""
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+        
+        # Mostrar fuentes si es una respuesta del asistente
+        if message["role"] == "assistant" and "sources" in message and message["sources"]:
+            with st.expander(f"📄 Ver fuentes ({len(message['sources'])})"):
+                for source_index, source in enumerate(message["sources"]):
+                    if compact:
+                        st.markdown(f"**{source_index + 1}.** 📄 {source['filename']} (fragmento {source['chunk_id']})")
+                    else:
+                        st.markdown(f"**{source_index + 1}.**")
+                        display_source_with_file_info(source, available_pdfs, message_index, source_index)
+                        st.markdown("---")
+
+@st.fragment
+def render_history(available_pdfs):
+    """Muestra el historial; el coste por interacción no crece con la longitud de la conversación"""
+    messages = st.session_state.messages
+    split = max(0, len(messages) - HISTORY_RECENT_MESSAGES)
+    
+    # Mensajes anteriores: ocultos por defecto y, si se abren, solo una página a la vez.
+    # Al ser un fragmento, cambiar de página no vuelve a ejecutar toda la app
+    if split:
+        if st.toggle(f"🕘 Ver mensajes anteriores ({split})", key="show_older_history"):
+            total_pages = (split + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+            page = st.number_input(
+                f"Página (de {total_pages})",
+                min_value=1,
+                max_value=total_pages,
+                value=total_pages,
+                key="history_page"
+            )
+            start = (page - 1) * HISTORY_PAGE_SIZE
+            for message_index in range(start, min(start + HISTORY_PAGE_SIZE, split)):
+                render_message(messages[message_index], message_index, available_pdfs, compact=True)
+            st.markdown("---")
+    
+    for message_index in range(split, len(messages)):
+        render_message(messages[message_index], message_index, available_pdfs)
+
 def main():
     # Verificar configuración primero
     if not check_configuration():
@@ -283,9 +390,33 @@ def main():
         # Mostrar solo información básica de los PDFs disponibles
         if available_pdfs:
             st.markdown("### 📚 Documentos Disponibles")
-            for filename, filepath in available_pdfs.items():
-                file_size = get_file_size(filepath)
-                st.markdown(f"📄 **{filename}** ({file_size})")
+            snapshot = get_snapshot()
+            if snapshot is not None:
+                for doc in snapshot["documents"]:
+                    st.markdown(f"📄 **{doc['filename']}** ({format_size(doc['size_bytes'])}, {doc['pages']} págs.)")
+                st.caption(f"Ingesta {snapshot['ingest_version']}")
+            else:
+                for filename, filepath in available_pdfs.items():
+                    file_size = get_file_size(filepath)
+                    st.markdown(f"📄 **{filename}** ({file_size})")
+        
+        profiler = get_profiler()
+        if profiler.enabled:
+            record_session_memory()
+            report = profiler.report("app")
+            session = report["sessions"]["by_session"].get(st.session_state.session_id, {})
+            st.markdown("### 🧠 Perfilado")
+            st.caption(
+                f"Esta sesión: {session.get('chatbot_kb', 0):.0f} KB de chatbot, "
+                f"{session.get('messages_kb', 0):.0f} KB de historial · "
+                f"{report['sessions']['count']} sesiones, {report['sessions']['total_kb'] / 1024:.1f} MB en total"
+            )
+            st.download_button(
+                "⬇️ Informe de perfilado",
+                data=json.dumps(report, ensure_ascii=False, indent=2),
+                file_name="perfil-app.json",
+                mime="application/json"
+            )
         
         if st.button("🔄 Limpiar Chat"):
             st.session_state.messages = []
@@ -295,17 +426,7 @@ def main():
     st.markdown("### 💬 Haz preguntas sobre los documentos")
     
     # Mostrar historial de mensajes
-    for message_index, message in enumerate(st.session_state.messages):
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-            
-            # Mostrar fuentes si es una respuesta del asistente
-            if message["role"] == "assistant" and "sources" in message and message["sources"]:
-                with st.expander(f"📄 Ver fuentes ({len(message['sources'])})"):
-                    for source_index, source in enumerate(message["sources"]):
-                        st.markdown(f"**{source_index + 1}.**")
-                        display_source_with_file_info(source, available_pdfs, message_index, source_index)
-                        st.markdown("---")
+    render_history(available_pdfs)
     
     # Input para nueva pregunta
     if prompt := st.chat_input("Escribe tu pregunta aquí..."):
@@ -318,7 +439,7 @@ def main():
         # Generar respuesta
         with st.chat_message("assistant"):
             with st.spinner("🤔 Analizando documentos..."):
-                response = st.session_state.chatbot.chat(prompt)
+                response = st.session_state.chatbot.chat(prompt, user_id=st.session_state.session_id)
             
             st.markdown(response["answer"])
             
@@ -338,6 +459,7 @@ def main():
             "content": response["answer"],
             "sources": response["sources"]
         })
+        record_session_memory()
     
     # Mensaje de ayuda al final
     if len(st.session_state.messages) == 0:
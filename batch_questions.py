@@ -0,0 +1,108 @@
+# batch_questions.py
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from metrics import latency_summary
+from rag_chatbot import RAGChatbot, normalize_question
+
+def load_questions(input_path):
+    """Lee preguntas de un JSONL ({"id": ..., "question": ...} por línea)"""
+    questions = []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            questions.append({
+                "id": item.get("id", line_num),
+                "question": item["question"]
+            })
+    return questions
+
+def answer(chatbot, question):
+    """Responde una pregunta midiendo su latencia"""
+    start = time.perf_counter()
+    try:
+        result = chatbot.chat(question, user_id="lote")
+    except Exception as e:
+        result = {"answer": f"❌ Error procesando la consulta: {e}", "sources": [], "success": False}
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Responde en lote las preguntas de un archivo JSONL")
+    parser.add_argument("input", help="JSONL con un objeto {\"id\", \"question\"} por línea")
+    parser.add_argument("--output", default="respuestas.jsonl", help="JSONL de salida")
+    parser.add_argument("--workers", type=int, default=8, help="Preguntas simultáneas")
+    args = parser.parse_args()
+    
+    questions = load_questions(args.input)
+    
+    # Agrupar preguntas idénticas para ejecutarlas una sola vez
+    groups = {}
+    for item in questions:
+        groups.setdefault(normalize_question(item["question"]), []).append(item)
+    
+    print(f"📋 {len(questions)} preguntas ({len(groups)} únicas), {args.workers} workers")
+    
+    chatbot = RAGChatbot()
+    if not chatbot.setup_retrieval_chain():
+        print("❌ No se pudo configurar el chatbot")
+        return
+    
+    latencies = []
+    errors = 0
+    degraded = 0  # respuestas de contingencia (sobrecarga o tiempo agotado)
+    partial = 0  # respuestas cortadas por el plazo
+    start = time.perf_counter()
+    
+    with ThreadPoolExecutor(max_workers=args.workers) as executor, \
+            open(args.output, "w", encoding="utf-8") as output:
+        futures = {
+            executor.submit(answer, chatbot, items[0]["question"]): items
+            for items in groups.values()
+        }
+        
+        # Los resultados se escriben a medida que terminan
+        for done, future in enumerate(as_completed(futures), 1):
+            items = futures[future]
+            result, latency = future.result()
+            latencies.append(latency)
+            if not result["success"]:
+                errors += len(items)
+            elif result.get("partial"):
+                partial += len(items)
+            elif result.get("degraded"):
+                degraded += len(items)
+            
+            for position, item in enumerate(items):
+                record = {
+                    "id": item["id"],
+                    "question": item["question"],
+                    "answer": result["answer"],
+                    "sources": result["sources"],
+                    "success": result["success"],
+                    "degraded": result.get("degraded", False),
+                    "partial": result.get("partial", False),
+                    "latency_s": round(latency, 3),
+                    "deduplicated": position > 0
+                }
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            
+            print(f"✅ {done}/{len(groups)} ({latency:.1f} s) {items[0]['question'][:50]}")
+    
+    elapsed = time.perf_counter() - start
+    summary = latency_summary(latencies)
+    
+    print(f"\n📊 Resumen")
+    print(f"  Preguntas: {len(questions)} ({len(groups)} únicas, {errors} con error)")
+    print(f"  Respuestas degradadas: {degraded} | incompletas: {partial}")
+    print(f"  Tiempo total: {elapsed:.1f} s")
+    print(f"  Rendimiento: {len(questions) / elapsed:.2f} preguntas/s")
+    print(f"  Latencia: p50 {summary['p50']:.2f} s | p90 {summary['p90']:.2f} s | "
+          f"p99 {summary['p99']:.2f} s | máx {summary['max']:.2f} s")
+    print(f"💾 Resultados en {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# benchmark_ivf.py
+import argparse
+import time
+import numpy as np
+from config import Config
+from ivf_index import IVFIndex
+
+def make_corpus(num_vectors, dimension, num_topics, seed=0):
+    """Genera vectores sintéticos agrupados por temas (como chunks de documentos)"""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(num_topics, dimension)).astype(np.float32)
+    labels = rng.integers(0, num_topics, size=num_vectors)
+    vectors = topics[labels] + 1.5 * rng.normal(size=(num_vectors, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def brute_force(vectors, queries, k):
+    """Top-k exacto por búsqueda exhaustiva"""
+    results = []
+    for query in queries:
+        scores = vectors @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        results.append(set(top[np.argsort(-scores[top])].tolist()))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark latencia/recall del índice IVF local")
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=Config.EMBEDDING_DIMENSIONS)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--nlist", type=int, default=0)
+    args = parser.parse_args()
+    
+    print(f"🔄 Generando {args.vectors} vectores de dimensión {args.dimension}...")
+    corpus = make_corpus(args.vectors + args.queries, args.dimension, num_topics=200)
+    vectors, queries = corpus[:args.vectors], corpus[args.vectors:]
+    
+    # Búsqueda exhaustiva como referencia
+    start = time.perf_counter()
+    truth = brute_force(vectors, queries, args.k)
+    brute_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"📏 Exhaustiva: {brute_ms:.2f} ms/consulta")
+    
+    # Construcción del índice
+    index = IVFIndex(args.dimension, nlist=args.nlist)
+    ids = [str(i) for i in range(len(vectors))]
+    start = time.perf_counter()
+    index.train(vectors)
+    index.add(ids, vectors)
+    print(f"🏗️  IVF ({index.nlist} particiones): construido en {time.perf_counter() - start:.2f} s")
+    
+    print(f"\n{'nprobe':>8} {'ms/consulta':>12} {'recall@' + str(args.k):>10} {'aceleración':>12}")
+    nprobe = 1
+    while nprobe <= index.nlist:
+        start = time.perf_counter()
+        found = [index.search(query, k=args.k, nprobe=nprobe) for query in queries]
+        ivf_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        
+        recall = np.mean([
+            len(truth[i] & {int(vector_id) for vector_id, _ in found[i]}) / args.k
+            for i in range(len(queries))
+        ])
+        print(f"{nprobe:>8} {ivf_ms:>12.3f} {recall:>10.3f} {brute_ms / ivf_ms:>11.1f}x")
+        nprobe *= 2
+    
+    print("\n💡 Ajusta IVF_NPROBE en el .env según el recall que necesites")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# benchmark_splitter.py
+import argparse
+import statistics
+import time
+from document_processor import DocumentProcessor
+from token_splitter import join_pages
+
+def measure(split, pages, repeats):
+    """Ejecuta el splitter varias veces y retorna (mejor tiempo en ms, chunks)"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks = split(pages)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, chunks
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara el splitter por tokens con RecursiveCharacterTextSplitter")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10],
+                        help="Multiplica el corpus para comprobar el coste lineal")
+    args = parser.parse_args()
+    
+    processor = DocumentProcessor()
+    corpus = []
+    for pdf_path in processor.get_pdf_files():
+        corpus.extend(processor.load_pages(pdf_path))
+    
+    splitters = {
+        "recursive": lambda pages: processor.text_splitter.split_text(join_pages(pages)),
+        "tokens": lambda pages: [chunk["text"] for chunk in processor.token_splitter.split_pages(pages)]
+    }
+    
+    limit = processor.config.CHUNK_TOKENS
+    print(f"📄 {len(corpus)} páginas, {len(join_pages(corpus))} caracteres")
+    print(f"🎯 Objetivo: {limit} tokens por chunk (recursive usa {processor.config.CHUNK_SIZE} caracteres)\n")
+    print(f"{'splitter':>10} {'escala':>7} {'ms':>10} {'chunks':>7} {'tokens medio':>13} {'tokens máx':>11} {'> objetivo':>11}")
+    
+    for scale in args.scale:
+        pages = corpus * scale
+        for name, split in splitters.items():
+            elapsed, chunks = measure(split, pages, args.repeats)
+            sizes = [len(tokens) for tokens in processor.encoding.encode_ordinary_batch(chunks)]
+            over = sum(size > limit for size in sizes) / len(sizes)
+            print(f"{name:>10} {scale:>7} {elapsed:>10.1f} {len(chunks):>7} "
+                  f"{statistics.mean(sizes):>13.1f} {max(sizes):>11} {over:>10.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# cassette.py - Grabación y reproducción de llamadas a OpenAI y Pinecone
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.vectorstores import VectorStore
+from config import Config
+
+class CassetteMiss(KeyError):
+    """La petición no está grabada en el cassette"""
+
+class Cassette:
+    """Archivo JSONL con peticiones, respuestas y latencias de servicios externos"""
+
+    def __init__(self, path: str, mode: str = "record", simulate_latency: bool = False):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Modo de cassette desconocido: {mode}")
+
+        self.path = path
+        self.mode = mode
+        self.simulate_latency = simulate_latency
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[dict]] = {}
+        self._cursors: Dict[str, int] = {}
+
+        if mode == "replay":
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"No existe el cassette {self.path}")
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+
+    @staticmethod
+    def request_key(kind: str, request: dict) -> str:
+        payload = json.dumps({"kind": kind, "request": request}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, kind: str, request: dict) -> dict:
+        """Retorna la entrada grabada (en orden si la misma petición se grabó varias veces)"""
+        key = self.request_key(kind, request)
+
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"Petición '{kind}' no grabada en {self.path}")
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            return entries[cursor % len(entries)]
+
+    def record(self, kind: str, request: dict, response: Any, latency: float):
+        """Añade una interacción al cassette"""
+        entry = {
+            "key": self.request_key(kind, request),
+            "kind": kind,
+            "request": request,
+            "response": response,
+            "latency": latency
+        }
+
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def call(self, kind: str, request: dict, fn: Callable[[], Any]) -> Any:
+        """Ejecuta y graba fn, o reproduce su respuesta grabada"""
+        if self.mode == "replay":
+            entry = self.lookup(kind, request)
+            if self.simulate_latency:
+                time.sleep(entry["latency"])
+            return entry["response"]
+
+        start = time.perf_counter()
+        response = fn()
+        self.record(kind, request, response, time.perf_counter() - start)
+        return response
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+def get_cassette() -> Optional[Cassette]:
+    """Cassette del proceso según CASSETTE_MODE (None si está desactivado)"""
+    global _cassette
+
+    if Config.CASSETTE_MODE == "off":
+        return None
+
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(Config.CASSETTE_PATH, Config.CASSETTE_MODE, Config.CASSETTE_SIMULATE_LATENCY)
+        return _cassette
+
+class CassetteEmbeddings(Embeddings):
+    """Embeddings que se graban o reproducen desde un cassette"""
+
+    def __init__(self, inner: Optional[Embeddings], cassette: Cassette, model: str, dimensions: int):
+        self.inner = inner
+        self.cassette = cassette
+        self.model = model
+        self.dimensions = dimensions
+
+    def _request(self, texts) -> dict:
+        return {"model": self.model, "dimensions": self.dimensions, "texts": texts}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.cassette.call("embed_documents", self._request(list(texts)),
+                                  lambda: self.inner.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.cassette.call("embed_query", self._request(text),
+                                  lambda: self.inner.embed_query(text))
+
+class CassetteVectorStore(VectorStore):
+    """Búsquedas del vector store grabadas o reproducidas desde un cassette"""
+
+    def __init__(self, inner: Optional[VectorStore], cassette: Cassette, index_name: str,
+                 embedding: Optional[Embeddings] = None):
+        self.inner = inner
+        self.cassette = cassette
+        self.index_name = index_name
+        self._embedding = embedding
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding
+
+    def add_texts(self, texts, metadatas=None, **kwargs) -> List[str]:
+        if self.inner is None:
+            raise RuntimeError("No se pueden almacenar documentos en modo replay")
+        return self.inner.add_texts(texts, metadatas=metadatas, **kwargs)
+
+    def _call(self, request: dict, search: Callable[[], List[Tuple[Document, float]]]) -> List[Tuple[Document, float]]:
+        def serialized():
+            return [
+                {"page_content": doc.page_content, "metadata": doc.metadata, "score": score}
+                for doc, score in search()
+            ]
+
+        results = self.cassette.call("vector_search", request, serialized)
+        return [(Document(page_content=r["page_content"], metadata=r["metadata"]), r["score"]) for r in results]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        request = {"index": self.index_name, "query": query, "k": k}
+        if kwargs.get("filter"):
+            request["filter"] = kwargs["filter"]
+        return self._call(request, lambda: self.inner.similarity_search_with_score(query, k=k, **kwargs))
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               **kwargs) -> List[Tuple[Document, float]]:
+        # El vector de consulta se identifica por su hash (también sale del cassette al reproducir)
+        vector_hash = hashlib.sha256(json.dumps(list(embedding)).encode("utf-8")).hexdigest()
+        request = {"index": self.index_name, "vector": vector_hash, "k": k}
+        if kwargs.get("filter"):
+            request["filter"] = kwargs["filter"]
+        return self._call(request, lambda: self.inner.similarity_search_by_vector_with_score(embedding, k=k, **kwargs))
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, store_cls: type, cassette: Optional[Cassette] = None,
+                   index_name: str = "", **kwargs) -> "CassetteVectorStore":
+        """Crea el vector store interno con store_cls.from_texts y lo envuelve en el cassette del proceso"""
+        cassette = cassette or get_cassette()
+        if cassette is None:
+            raise RuntimeError("CASSETTE_MODE está desactivado")
+        if cassette.mode == "replay":
+            raise RuntimeError("No se pueden almacenar documentos en modo replay")
+
+        inner = store_cls.from_texts(texts, embedding, metadatas=metadatas, **kwargs)
+        return cls(inner, cassette, index_name or store_cls.__name__, embedding)
+
+class CassetteChatModel(BaseChatModel):
+    """Modelo de chat cuyas respuestas se graban o reproducen desde un cassette"""
+
+    inner: Optional[BaseChatModel] = None
+    cassette: Any = None
+    model_name: str = ""
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-chat"
+
+    def _request(self, messages: List[BaseMessage]) -> dict:
+        return {"model": self.model_name, "messages": [[m.type, m.content] for m in messages]}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        def invoke():
+            response = self.inner.invoke(messages, **kwargs)
+            return {"content": response.content, "response_metadata": response.response_metadata}
+
+        response = self.cassette.call("chat", self._request(messages), invoke)
+        message = AIMessage(content=response["content"], response_metadata=response["response_metadata"])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        request = self._request(messages)
+
+        if self.cassette.mode == "replay":
+            entry = self.cassette.lookup("chat_stream", request)
+            start = time.perf_counter()
+            for chunk in entry["response"]["chunks"]:
+                # Respeta el momento en que llegó cada fragmento durante la grabación
+                if self.cassette.simulate_latency:
+                    time.sleep(max(0.0, chunk["at"] - (time.perf_counter() - start)))
+                yield ChatGenerationChunk(message=AIMessageChunk(
+                    content=chunk["content"], usage_metadata=chunk.get("usage_metadata")
+                ))
+            return
+
+        start = time.perf_counter()
+        chunks = []
+        for chunk in self.inner.stream(messages, **kwargs):
+            chunks.append({
+                "content": chunk.content,
+                "usage_metadata": chunk.usage_metadata,
+                "at": time.perf_counter() - start
+            })
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=chunk.content, usage_metadata=chunk.usage_metadata
+            ))
+        self.cassette.record("chat_stream", request, {"chunks": chunks}, time.perf_counter() - start)
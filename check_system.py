@@ -1,4 +1,9 @@
 # check_system.py
+import argparse
+import contextlib
+import json
+import sys
+
 def check_complete_system():
     print("🔍 Verificando sistema completo RAG...")
     
@@ -85,5 +90,28 @@ def check_complete_system():
     print("💡 Puedes ejecutar: python test_chatbot.py")
     return True
 
+def check_health(full=False, timeout=None):
+    """Comprobación rápida en paralelo con salida JSON (para balanceadores y monitorización)"""
+    from health import run_probes, READINESS_PROBES, FULL_PROBES
+    
+    # Los mensajes de las sondas (p. ej. los del chatbot con --full) van a stderr:
+    # stdout lleva solo el informe JSON
+    stdout = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_probes(FULL_PROBES if full else READINESS_PROBES, timeout=timeout)
+        print(json.dumps(report, ensure_ascii=False, indent=2), file=stdout)
+    return report["status"] == "ok"
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica el sistema RAG")
+    parser.add_argument("--health", action="store_true",
+                        help="Sondas en paralelo con salida JSON, sin llamar al LLM")
+    parser.add_argument("--full", action="store_true",
+                        help="Con --health, incluye una pregunta real al chatbot")
+    parser.add_argument("--timeout", type=float, default=None, help="Timeout en segundos para todas las sondas (por defecto, el de cada sonda)")
+    args = parser.parse_args()
+    
+    if args.health:
+        sys.exit(0 if check_health(args.full, args.timeout) else 1)
+    
     check_complete_system()
\ No newline at end of file
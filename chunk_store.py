@@ -0,0 +1,227 @@
+# chunk_store.py - Textos de los chunks en disco (memoria mapeada) para no traerlos de Pinecone en cada consulta
+import json
+import mmap
+import os
+import threading
+import uuid
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# Metadata que se conserva en Pinecone (necesaria para filtrar)
+FILTER_FIELDS = ("source", "section_id")
+# Clave del texto en la metadata de Pinecone (la misma que usa langchain_pinecone)
+TEXT_KEY = "text"
+
+def filter_fields(filter: dict) -> set:
+    """Campos de metadata que usa un filtro de Pinecone (sin operadores como $and/$or)"""
+    fields = set()
+    for key, value in filter.items():
+        if key in ("$and", "$or"):
+            for condition in value:
+                fields |= filter_fields(condition)
+        else:
+            fields.add(key)
+    return fields
+
+_INDEX_DTYPE = np.dtype([("id", "U64"), ("offset", "i8"), ("meta_length", "i4"), ("text_length", "i4")])
+
+class ChunkStore:
+    """Registros [metadata JSON][texto UTF-8] en un archivo mapeado en memoria, con índice ordenado por id"""
+
+    DATA_FILE = "chunks.bin"
+    INDEX_FILE = "chunks_index.npy"
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._data = None
+        self._index = np.empty(0, dtype=_INDEX_DTYPE)
+        self._open()
+
+    @classmethod
+    def exists(cls, folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, cls.INDEX_FILE))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _open(self):
+        index_path = os.path.join(self.folder, self.INDEX_FILE)
+        data_path = os.path.join(self.folder, self.DATA_FILE)
+        if not os.path.exists(index_path) or not os.path.exists(data_path) or not os.path.getsize(data_path):
+            return
+
+        # Ni los textos ni el índice se cargan en memoria: el sistema operativo pagina lo que se lee
+        self._index = np.load(index_path, mmap_mode="r")
+        with open(data_path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def append(self, ids: List[str], texts: List[str], metadatas: List[dict]):
+        """Añade chunks al final del archivo y reescribe el índice de forma atómica"""
+        os.makedirs(self.folder, exist_ok=True)
+        entries = np.empty(len(ids), dtype=_INDEX_DTYPE)
+
+        with self._lock:
+            with open(os.path.join(self.folder, self.DATA_FILE), "ab") as f:
+                offset = f.tell()
+                for i, (chunk_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                    meta_bytes = json.dumps(metadata, ensure_ascii=False).encode("utf-8")
+                    text_bytes = text.encode("utf-8")
+                    f.write(meta_bytes)
+                    f.write(text_bytes)
+                    entries[i] = (chunk_id, offset, len(meta_bytes), len(text_bytes))
+                    offset += len(meta_bytes) + len(text_bytes)
+
+            index = np.concatenate([np.asarray(self._index), entries])
+            index = index[np.argsort(index["id"], kind="stable")]
+
+            tmp_path = os.path.join(self.folder, f"tmp-{self.INDEX_FILE}")
+            np.save(tmp_path, index)
+            os.replace(tmp_path, os.path.join(self.folder, self.INDEX_FILE))
+
+            if self._data is not None:
+                self._data.close()
+            self._open()
+
+    def _locate(self, chunk_id: str) -> Optional[tuple]:
+        ids = self._index["id"]
+        position = int(np.searchsorted(ids, chunk_id))
+        if position < len(ids) and ids[position] == chunk_id:
+            entry = self._index[position]
+            return int(entry["offset"]), int(entry["meta_length"]), int(entry["text_length"])
+        return None
+
+    def get(self, chunk_id: str) -> Optional[Tuple[str, dict]]:
+        """Texto y metadata de un chunk (None si no está)"""
+        location = self._locate(chunk_id)
+        if location is None:
+            return None
+
+        offset, meta_length, text_length = location
+        view = memoryview(self._data)
+        metadata = json.loads(bytes(view[offset:offset + meta_length]))
+        text = str(view[offset + meta_length:offset + meta_length + text_length], "utf-8")
+        return text, metadata
+
+class PineconeIdVectorStore(VectorStore):
+    """Vector store de Pinecone que lee los textos del ChunkStore local cuando lo hay
+
+    Con text_in_metadata Pinecone guarda además el texto y toda la metadata: los procesos sin
+    ChunkStore (la app desplegada en otra máquina) la piden en la consulta. Sin él, Pinecone
+    guarda solo ids y campos de filtro y el ChunkStore es obligatorio.
+    """
+
+    def __init__(self, index, embedding: Embeddings, chunk_store: Optional[ChunkStore],
+                 namespace: Optional[str] = None, batch_size: int = 100, text_in_metadata: bool = False,
+                 request_timeout: Optional[float] = None):
+        if chunk_store is None and not text_in_metadata:
+            raise ValueError("Sin texto en la metadata de Pinecone hace falta un ChunkStore")
+        self.index = index
+        self.embedding = embedding
+        self.chunk_store = chunk_store
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.text_in_metadata = text_in_metadata
+        self.request_timeout = request_timeout  # por consulta (segundos); None = el del cliente
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        # Primero los textos: un id en Pinecone siempre tiene su texto local
+        if self.chunk_store is not None:
+            self.chunk_store.append(ids, texts, metadatas)
+
+        for start in range(0, len(texts), self.batch_size):
+            end = start + self.batch_size
+            vectors = self.embedding.embed_documents(texts[start:end])
+            self.index.upsert(
+                vectors=[
+                    {"id": chunk_id, "values": values, "metadata": self._pinecone_metadata(text, metadata)}
+                    for chunk_id, values, text, metadata
+                    in zip(ids[start:end], vectors, texts[start:end], metadatas[start:end])
+                ],
+                namespace=self.namespace
+            )
+
+        return ids
+
+    def _pinecone_metadata(self, text: str, metadata: dict) -> dict:
+        if self.text_in_metadata:
+            return dict(metadata, **{TEXT_KEY: text})
+        return {key: metadata[key] for key in FILTER_FIELDS if key in metadata}
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k, **kwargs)
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None, **kwargs) -> List[Tuple[Document, float]]:
+        # Un filtro sobre un campo que no está en Pinecone no coincidiría con nada, sin error
+        unknown = filter_fields(filter) - set(FILTER_FIELDS) if filter and not self.text_in_metadata else set()
+        if unknown:
+            raise ValueError(f"Campos no filtrables (Pinecone solo guarda {FILTER_FIELDS}): {sorted(unknown)}")
+        
+        # Con ChunkStore la respuesta no trae metadata: cada coincidencia ocupa unos pocos bytes
+        local = self.chunk_store is not None
+        timeout = {"_request_timeout": self.request_timeout} if self.request_timeout else {}
+        response = self.index.query(
+            vector=embedding, top_k=k, filter=filter, namespace=self.namespace, include_metadata=not local, **timeout
+        )
+
+        results = []
+        for match in response["matches"]:
+            if local:
+                stored = self.chunk_store.get(match["id"])
+                if stored is None:
+                    print(f"⚠️  Chunk {match['id']} sin texto local")
+                    continue
+                text, metadata = stored
+            else:
+                metadata = dict(match.get("metadata") or {})
+                if TEXT_KEY not in metadata:
+                    print(f"⚠️  Chunk {match['id']} sin texto en la metadata de Pinecone")
+                    continue
+                text = metadata.pop(TEXT_KEY)
+            results.append((Document(page_content=text, metadata=metadata), match["score"]))
+
+        return results
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Pinecone con métrica coseno ya retorna similitud
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, *,
+                   index=None, index_name: Optional[str] = None, chunk_store: Optional[ChunkStore] = None,
+                   chunk_store_folder: Optional[str] = None, namespace: Optional[str] = None,
+                   batch_size: int = 100, ids: Optional[List[str]] = None, text_in_metadata: bool = False,
+                   **kwargs) -> "PineconeIdVectorStore":
+        """Almacena los textos: índice (o index_name), ChunkStore (o su carpeta) y namespace desde kwargs"""
+        if index is None:
+            if index_name is None:
+                raise ValueError("Indica index o index_name")
+            from config import Config
+            from http_clients import get_pinecone_client
+            index = get_pinecone_client(Config().PINECONE_API_KEY).Index(index_name)
+        
+        if chunk_store is None:
+            if chunk_store_folder is None:
+                raise ValueError("Indica chunk_store o chunk_store_folder")
+            chunk_store = ChunkStore(chunk_store_folder)
+        
+        store = cls(index, embedding, chunk_store, namespace=namespace, batch_size=batch_size,
+                    text_in_metadata=text_in_metadata)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,238 @@
+# concurrency.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Hashable, Optional
+from metrics import latency_summary
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma clave en una sola ejecución"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.executed = 0
+        self.coalesced = 0
+    
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Ejecuta fn, o espera el resultado de la ejecución en curso con la misma clave"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.executed += 1
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            # Las llamadas que lleguen después ya no comparten este resultado
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+    
+    def stats(self) -> Dict[str, int]:
+        """Métricas de ejecuciones reales y peticiones agrupadas"""
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights)
+            }
+
+class AdmissionRejected(Exception):
+    """La cola de espera está llena o se agotó el tiempo de espera"""
+
+class _Ticket:
+    def __init__(self, user_id: Hashable):
+        self.user_id = user_id
+        self.granted = False
+
+class AdmissionController:
+    """Limita las llamadas simultáneas con una cola acotada y turnos equitativos por usuario"""
+    
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        # Una cola FIFO por usuario y un turno rotatorio entre usuarios con peticiones en espera
+        self._queues: Dict[Hashable, Deque[_Ticket]] = {}
+        self._turns: Deque[Hashable] = deque()
+        
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._queue_waits: Deque[float] = deque(maxlen=1000)
+    
+    @contextmanager
+    def slot(self, user_id: Hashable = "anonimo", timeout: Optional[float] = None):
+        """Ocupa una plaza durante el bloque; lanza AdmissionRejected si no la obtiene"""
+        self.acquire(user_id, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+    
+    def acquire(self, user_id: Hashable = "anonimo", timeout: Optional[float] = None):
+        """Ocupa una plaza hasta release() (para plazas que se liberan en otro hilo)"""
+        self._acquire(user_id, self.queue_timeout if timeout is None else min(timeout, self.queue_timeout))
+    
+    def try_acquire(self) -> bool:
+        """Ocupa una plaza solo si hay una libre sin esperar ni adelantar a la cola"""
+        with self._cond:
+            if self._active < self.max_concurrent and not self._queued:
+                self._active += 1
+                self._record_admission(0.0)
+                return True
+            return False
+    
+    def release(self):
+        self._release()
+    
+    def _acquire(self, user_id: Hashable, queue_timeout: float):
+        start = time.perf_counter()
+        
+        with self._cond:
+            if self._active < self.max_concurrent and not self._queued:
+                self._active += 1
+                self._record_admission(0.0)
+                return
+            
+            # Rechazo inmediato si la cola está llena: mejor una respuesta rápida que un timeout
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected("Cola de espera llena")
+            
+            ticket = _Ticket(user_id)
+            if user_id not in self._queues:
+                self._queues[user_id] = deque()
+                self._turns.append(user_id)
+            self._queues[user_id].append(ticket)
+            self._queued += 1
+            
+            deadline = start + queue_timeout
+            while not ticket.granted:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._withdraw(ticket)
+                    self.timed_out += 1
+                    raise AdmissionRejected("Tiempo de espera agotado en la cola")
+                self._cond.wait(remaining)
+            
+            self._record_admission(time.perf_counter() - start)
+    
+    def _withdraw(self, ticket: _Ticket):
+        queue = self._queues[ticket.user_id]
+        queue.remove(ticket)
+        self._queued -= 1
+        if not queue:
+            del self._queues[ticket.user_id]
+            self._turns.remove(ticket.user_id)
+    
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            
+            # Se atiende al siguiente usuario en turno, no a la petición más antigua:
+            # un usuario con muchas peticiones no bloquea a los demás
+            while self._active < self.max_concurrent and self._turns:
+                user_id = self._turns.popleft()
+                queue = self._queues[user_id]
+                ticket = queue.popleft()
+                if queue:
+                    self._turns.append(user_id)
+                else:
+                    del self._queues[user_id]
+                
+                ticket.granted = True
+                self._active += 1
+                self._queued -= 1
+            
+            self._cond.notify_all()
+    
+    def _record_admission(self, waited: float):
+        self.admitted += 1
+        self._queue_waits.append(waited)
+    
+    def stats(self) -> Dict:
+        """Estado de la cola y tiempos de espera recientes"""
+        with self._cond:
+            waits = latency_summary(list(self._queue_waits))
+            return {
+                "active": self._active,
+                "queued": self._queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "queue_wait_p50": waits["p50"],
+                "queue_wait_p95": waits["p95"],
+                "queue_wait_max": waits["max"]
+            }
+
+class DeadlineExceeded(TimeoutError):
+    """Una etapa de la consulta no terminó dentro de su plazo"""
+    
+    def __init__(self, stage: str):
+        super().__init__(f"Plazo agotado en la etapa '{stage}'")
+        self.stage = stage
+
+# Hilos para las etapas de recuperación con plazo: una llamada colgada se abandona y termina con
+# su propio timeout (el de la petición HTTP, igual al presupuesto de la etapa)
+_stage_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="etapa")
+
+class Deadline:
+    """Plazo de extremo a extremo de una consulta, repartido entre sus etapas"""
+    
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+    
+    def submit(self, fn: Callable, *args) -> Future:
+        return _stage_executor.submit(fn, *args)
+    
+    def run(self, stage: str, fn: Callable, *args, budget: Optional[float] = None) -> Any:
+        """Ejecuta fn con el menor entre su presupuesto y el tiempo restante; lanza DeadlineExceeded"""
+        timeout = self.remaining() if budget is None else min(budget, self.remaining())
+        if timeout <= 0:
+            raise DeadlineExceeded(stage)
+        
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            # Si aún esperaba un hilo libre no llega a ejecutarse
+            future.cancel()
+            raise DeadlineExceeded(stage) from None
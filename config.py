@@ -6,6 +6,17 @@ from io import StringIO
 # Cargar variables del archivo .env
 load_dotenv()
 
+# Dimensión nativa de text-embedding-3-small
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+BASE_INDEX_NAME = "documentos-cliente"
+
+def index_name_for_dimensions(dimensions: int) -> str:
+    """Nombre del índice de Pinecone para una dimensión de embeddings dada"""
+    # El índice original conserva su nombre; las dimensiones reducidas usan uno propio
+    if dimensions == DEFAULT_EMBEDDING_DIMENSIONS:
+        return BASE_INDEX_NAME
+    return f"{BASE_INDEX_NAME}-{dimensions}d"
+
 class Config:
     def __init__(self):
         # Detectar si estamos en Streamlit Cloud o desarrollo local
@@ -46,12 +57,101 @@ class Config:
         self.DOCUMENTS_FOLDER = os.getenv("DOCUMENTS_FOLDER", "documentos")
     
     # Configuraciones del sistema
+    # Splitter: "tokens" (por oraciones, medido con tiktoken) o "recursive" (por caracteres)
+    TEXT_SPLITTER = os.getenv("TEXT_SPLITTER", "tokens")
+    CHUNK_TOKENS = 256
+    CHUNK_OVERLAP_TOKENS = 48
     CHUNK_SIZE = 1000
     CHUNK_OVERLAP = 200
-    INDEX_NAME = "documentos-cliente"
+    TEXT_CACHE_FOLDER = ".cache/texto"
+    # Resumen de la última ingesta que la app carga al arrancar
+    SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "snapshot.json")
+    # Limpieza en la ingesta: encabezados/pies repetidos y chunks casi duplicados
+    STRIP_HEADERS_FOOTERS = True
+    DEDUP_THRESHOLD = 0.85  # Similitud de Jaccard estimada (0 desactiva la deduplicación)
     EMBEDDING_MODEL = "text-embedding-3-small"
+    # text-embedding-3-small admite salidas recortadas (p. ej. 768 o 384)
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", DEFAULT_EMBEDDING_DIMENSIONS))
+    INDEX_NAME = index_name_for_dimensions(EMBEDDING_DIMENSIONS)
+    
+    # Base vectorial: "pinecone" (por defecto) o "local" (índice IVF en disco)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+    LOCAL_INDEX_FOLDER = "indice_local"
+    IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = automático
+    # Particiones exploradas por consulta: más = mejor recall, menos = menor latencia
+    IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+    
+    # Re-indexación blue/green: cada ingesta escribe en un namespace (o carpeta local) nuevo.
+    # Con Pinecone, un registro de control en el propio índice indica cuál sirve las consultas
+    # (los procesos lo releen cada ACTIVE_INDEX_REFRESH segundos); con el índice local, el archivo
+    # ACTIVE_INDEX_PATH, que también se usa como valor inicial antes del primer registro
+    ACTIVE_INDEX_PATH = os.getenv("ACTIVE_INDEX_PATH", "indice_activo.json")
+    ACTIVE_INDEX_REFRESH = float(os.getenv("ACTIVE_INDEX_REFRESH", "10"))
+    INDEX_VERSIONS_KEPT = int(os.getenv("INDEX_VERSIONS_KEPT", "1"))  # versiones anteriores para rollback
+    REINDEX_VALIDATE_TIMEOUT = float(os.getenv("REINDEX_VALIDATE_TIMEOUT", "120"))
     CHAT_MODEL = "gpt-4o-mini-2024-07-18"
     
+    # Pool de conexiones HTTP compartido (OpenAI y Pinecone)
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+    
+    # Recuperación adaptativa: se piden RETRIEVAL_FETCH_K candidatos y se conservan
+    # los que superan el umbral absoluto y el relativo (fracción del mejor), hasta RETRIEVAL_MAX_K
+    RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", "12"))
+    RETRIEVAL_MAX_K = int(os.getenv("RETRIEVAL_MAX_K", "6"))
+    RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.25"))  # similitud coseno
+    RETRIEVAL_RELATIVE_SCORE = float(os.getenv("RETRIEVAL_RELATIVE_SCORE", "0.8"))
+    
+    # Recuperación jerárquica: primero documentos y secciones (grupos de SECTION_CHUNKS chunks),
+    # luego solo los chunks de las secciones elegidas
+    HIERARCHICAL_RETRIEVAL = os.getenv("HIERARCHICAL_RETRIEVAL", "1") == "1"
+    SECTION_CHUNKS = int(os.getenv("SECTION_CHUNKS", "8"))
+    RETRIEVAL_TOP_DOCUMENTS = int(os.getenv("RETRIEVAL_TOP_DOCUMENTS", "5"))
+    RETRIEVAL_TOP_SECTIONS = int(os.getenv("RETRIEVAL_TOP_SECTIONS", "10"))
+    SECTION_INDEX_FOLDER = "indice_secciones"
+    SECTION_CACHE_FOLDER = ".cache/secciones"
+    
+    # Textos de los chunks en disco local: las consultas de la máquina que los tiene piden solo ids a Pinecone
+    CHUNK_STORE_FOLDER = "textos_chunks"
+    # Copia del texto en la metadata de Pinecone para los procesos sin CHUNK_STORE_FOLDER (la app
+    # desplegada en otra máquina). Desactivar solo si esa carpeta se despliega junto con la app
+    CHUNK_TEXT_IN_METADATA = os.getenv("CHUNK_TEXT_IN_METADATA", "1") == "1"
+    
+    # Grabación/reproducción de llamadas a OpenAI y Pinecone: "off", "record" o "replay"
+    CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+    CASSETTE_PATH = os.getenv("CASSETTE_PATH", "cassettes/default.jsonl")
+    CASSETTE_SIMULATE_LATENCY = os.getenv("CASSETTE_SIMULATE_LATENCY", "0") == "1"
+    
+    # Timeout por sonda en las comprobaciones de salud (segundos)
+    HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))
+    HEALTH_OPENAI_PROBE_TIMEOUT = float(os.getenv("HEALTH_OPENAI_PROBE_TIMEOUT", "10"))
+    HEALTH_CHATBOT_PROBE_TIMEOUT = float(os.getenv("HEALTH_CHATBOT_PROBE_TIMEOUT", "45"))  # pregunta real al LLM
+    
+    # Control de admisión de llamadas al LLM (por proceso)
+    LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "8"))
+    LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+    LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "20"))
+    
+    # Plazo de extremo a extremo por consulta (segundos), con presupuesto propio para
+    # embedding y búsqueda; la generación usa el tiempo restante
+    REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "30"))
+    EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "3"))
+    SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", "3"))
+    # Hedging: si el primer token no llega antes del percentil LLM_HEDGE_PERCENTILE del tiempo
+    # hasta el primer token, se lanza una segunda petición idéntica y gana la primera en terminar
+    LLM_HEDGE = os.getenv("LLM_HEDGE", "1") == "1"
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "4"))  # con pocas muestras
+    LLM_HEDGE_MIN_DELAY = 0.5
+    LLM_HEDGE_MIN_SAMPLES = 20
+
+    # Perfilado opcional de memoria (tracemalloc) y CPU (cProfile sobre una fracción de las llamadas)
+    PROFILING = os.getenv("PROFILING", "0") == "1"
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.1"))
+    PROFILE_FOLDER = os.getenv("PROFILE_FOLDER", "perfiles")
+    PROFILE_TOP_ALLOCATIONS = 15
+    PROFILE_TOP_FUNCTIONS = 20
+
     def validate_keys(self):
         """Valida que las API keys estén configuradas"""
         errors = []
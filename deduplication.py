@@ -0,0 +1,114 @@
+# deduplication.py
+import re
+import zlib
+from collections import Counter
+from typing import List, Tuple
+import numpy as np
+
+# Primo mayor que 2^32 para las permutaciones universales de MinHash
+_MERSENNE_PRIME = 4294967311
+
+def _normalize_line(line: str) -> str:
+    """Normaliza una línea para comparar encabezados (los números de página varían)"""
+    return re.sub(r"\s+", " ", re.sub(r"\d+", "#", line)).strip().lower()
+
+def strip_repeated_headers_footers(pages: List[str], edge_lines: int = 3,
+                                   min_ratio: float = 0.5) -> Tuple[List[str], int]:
+    """Quita las líneas de encabezado/pie que se repiten en la mayoría de las páginas"""
+    if len(pages) < 3:
+        return pages, 0
+
+    # Cuenta en cuántas páginas aparece cada línea del borde superior o inferior
+    counts = Counter()
+    for page in pages:
+        lines = [line for line in page.splitlines() if line.strip()]
+        edges = {_normalize_line(line) for line in lines[:edge_lines] + lines[-edge_lines:]}
+        counts.update(edges)
+
+    min_pages = max(2, int(len(pages) * min_ratio))
+    repeated = {line for line, count in counts.items() if count >= min_pages and line}
+
+    if not repeated:
+        return pages, 0
+
+    cleaned_pages = []
+    removed = 0
+
+    for page in pages:
+        lines = page.splitlines()
+        content = [i for i, line in enumerate(lines) if line.strip()]
+        edge_indexes = set(content[:edge_lines] + content[-edge_lines:])
+
+        kept = []
+        for i, line in enumerate(lines):
+            if i in edge_indexes and _normalize_line(line) in repeated:
+                removed += 1
+            else:
+                kept.append(line)
+        cleaned_pages.append("\n".join(kept))
+
+    return cleaned_pages, removed
+
+class MinHashDeduplicator:
+    """Detecta chunks casi idénticos con MinHash + LSH por bandas"""
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, bands: int = 16,
+                 shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm debe ser múltiplo de bands")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        # a < 2^31 evita desbordar uint64 en a * hash
+        self.perm_a = rng.integers(1, 2**31, size=num_perm, dtype=np.uint64)
+        self.perm_b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def _shingles(self, text: str) -> np.ndarray:
+        words = re.findall(r"\w+", text.lower())
+        if len(words) < self.shingle_size:
+            grams = [" ".join(words)]
+        else:
+            grams = [" ".join(words[i:i + self.shingle_size])
+                     for i in range(len(words) - self.shingle_size + 1)]
+        return np.array(sorted({zlib.crc32(gram.encode("utf-8")) for gram in grams}), dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Firma MinHash de un texto"""
+        hashes = self._shingles(text)
+        permuted = (np.outer(hashes, self.perm_a) + self.perm_b) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+    def find_duplicates(self, texts: List[str]) -> List[int]:
+        """Retorna los índices de los textos que repiten uno anterior"""
+        buckets = {}
+        signatures = []
+        duplicates = []
+
+        for i, text in enumerate(texts):
+            signature = self.signature(text)
+            band_keys = [
+                (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)
+            ]
+
+            # Candidatos: textos anteriores que comparten al menos una banda
+            candidates = {j for key in band_keys for j in buckets.get(key, ())}
+            is_duplicate = any(
+                np.mean(signatures[j] == signature) >= self.threshold for j in candidates
+            )
+
+            signatures.append(signature)
+            if is_duplicate:
+                duplicates.append(i)
+                continue
+
+            # Solo los textos conservados sirven de referencia
+            for key in band_keys:
+                buckets.setdefault(key, []).append(i)
+
+        return duplicates
@@ -1,10 +1,16 @@
 # document_processor.py (Versión Local Simplificada)
 import os
 from typing import List
+import tiktoken
 from PyPDF2 import PdfReader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 from config import Config
+from text_cache import PageTextCache
+from deduplication import MinHashDeduplicator, strip_repeated_headers_footers
+from token_splitter import SentenceTokenSplitter, join_pages
+from section_index import assign_sections
+from profiling import profiled
 
 class DocumentProcessor:
     def __init__(self):
@@ -14,6 +20,15 @@ class DocumentProcessor:
             chunk_overlap=self.config.CHUNK_OVERLAP,
             separators=["\n\n", "\n", " ", ""]
         )
+        self.text_cache = PageTextCache(self.config.TEXT_CACHE_FOLDER)
+        self.encoding = tiktoken.encoding_for_model(self.config.EMBEDDING_MODEL)
+        self.token_splitter = SentenceTokenSplitter(
+            encoding=self.encoding,
+            chunk_tokens=self.config.CHUNK_TOKENS,
+            overlap_tokens=self.config.CHUNK_OVERLAP_TOKENS
+        )
+        self.dedup_stats = {"header_footer_lines": 0, "duplicate_chunks": 0, "duplicate_tokens": 0}
+        self.document_stats = {}
     
     def get_pdf_files(self) -> List[str]:
         """Obtiene lista de archivos PDF de la carpeta local"""
@@ -32,25 +47,49 @@ class DocumentProcessor:
         print(f"📁 Encontrados {len(pdf_files)} archivos PDF")
         return pdf_files
     
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extrae texto de un archivo PDF"""
-        try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                text = ""
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += f"\n--- Página {page_num + 1} ---\n"
-                        text += page_text + "\n"
-                
-                return text
+    def extract_pages_from_pdf(self, pdf_path: str) -> List[str]:
+        """Extrae el texto de cada página, reutilizando la caché si el PDF no cambió"""
+        file_hash = self.text_cache.file_hash(pdf_path)
+        pages = self.text_cache.get_pages(file_hash)
+        
+        if pages is not None:
+            return pages
         
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PdfReader(file)
+            pages = [page.extract_text() or "" for page in pdf_reader.pages]
+        
+        self.text_cache.put_pages(file_hash, pages)
+        return pages
+    
+    @profiled("ingesta.extraccion", sample=1.0)
+    def load_pages(self, pdf_path: str) -> List[str]:
+        """Extrae el texto de cada página sin encabezados ni pies repetidos"""
+        try:
+            pages = self.extract_pages_from_pdf(pdf_path)
         except Exception as e:
             print(f"❌ Error procesando {pdf_path}: {e}")
-            return ""
+            return []
+        
+        if self.config.STRIP_HEADERS_FOOTERS:
+            pages, removed_lines = strip_repeated_headers_footers(pages)
+            self.dedup_stats["header_footer_lines"] += removed_lines
+        
+        return pages
     
+    def extract_text_from_pdf(self, pdf_path: str) -> str:
+        """Extrae texto de un archivo PDF"""
+        return join_pages(self.load_pages(pdf_path))
+    
+    @profiled("ingesta.division", sample=1.0)
+    def split_pages(self, pages: List[str]) -> List[dict]:
+        """Divide las páginas en chunks con el splitter configurado"""
+        if self.config.TEXT_SPLITTER == "recursive":
+            return [{"text": chunk} for chunk in self.text_splitter.split_text(join_pages(pages))]
+        
+        return self.token_splitter.split_pages(pages)
+    
+    @profiled("ingesta.total", sample=0, snapshot=True)
     def process_documents(self) -> List[Document]:
         """Procesa todos los documentos PDF de la carpeta local"""
         pdf_files = self.get_pdf_files()
@@ -60,35 +99,68 @@ class DocumentProcessor:
             return []
         
         documents = []
+        self.dedup_stats = {"header_footer_lines": 0, "duplicate_chunks": 0, "duplicate_tokens": 0}
+        self.document_stats = {}
         
         for pdf_path in pdf_files:
             filename = os.path.basename(pdf_path)
             print(f"🔄 Procesando: {filename}")
             
             # Extraer texto del PDF
-            text = self.extract_text_from_pdf(pdf_path)
+            pages = self.load_pages(pdf_path)
             
-            if text.strip():
+            if any(page.strip() for page in pages):
                 # Crear chunks del texto
-                chunks = self.text_splitter.split_text(text)
+                chunks = self.split_pages(pages)
                 
                 # Crear documentos con metadata
                 for i, chunk in enumerate(chunks):
-                    if chunk.strip():  # Solo chunks no vacíos
-                        doc = Document(
-                            page_content=chunk,
-                            metadata={
-                                "source": filename,
-                                "file_path": pdf_path,
-                                "chunk_id": i,
-                                "total_chunks": len(chunks)
-                            }
-                        )
-                        documents.append(doc)
+                    if chunk["text"].strip():  # Solo chunks no vacíos
+                        metadata = {
+                            "source": filename,
+                            "file_path": pdf_path,
+                            "chunk_id": i,
+                            "total_chunks": len(chunks)
+                        }
+                        # Páginas, offsets y tokens (solo con el splitter por tokens)
+                        metadata.update({key: value for key, value in chunk.items() if key != "text"})
+                        
+                        documents.append(Document(page_content=chunk["text"], metadata=metadata))
                 
+                self.document_stats[filename] = {"file_path": pdf_path, "pages": len(pages), "chunks": len(chunks)}
                 print(f"✅ {filename}: {len(chunks)} chunks creados")
             else:
                 print(f"⚠️  {filename}: No se pudo extraer texto")
         
+        documents = self.remove_near_duplicates(documents)
+        assign_sections(documents, self.config.SECTION_CHUNKS)
+        
+        # Chunks finales por documento (tras eliminar duplicados)
+        for stats in self.document_stats.values():
+            stats["chunks"] = 0
+        for doc in documents:
+            self.document_stats[doc.metadata["source"]]["chunks"] += 1
+        
+        print(f"💾 Caché de texto: {self.text_cache.hits} PDFs reutilizados, {self.text_cache.misses} extraídos")
         print(f"🎉 Total: {len(documents)} chunks procesados de {len(pdf_files)} PDFs")
-        return documents
\ No newline at end of file
+        return documents
+    
+    @profiled("ingesta.duplicados", sample=1.0)
+    def remove_near_duplicates(self, documents: List[Document]) -> List[Document]:
+        """Elimina chunks casi idénticos (boilerplate, avisos legales) antes de generar embeddings"""
+        if not self.config.DEDUP_THRESHOLD or not documents:
+            return documents
+        
+        deduplicator = MinHashDeduplicator(threshold=self.config.DEDUP_THRESHOLD)
+        duplicates = set(deduplicator.find_duplicates([doc.page_content for doc in documents]))
+        
+        removed_tokens = sum(
+            len(self.encoding.encode(documents[i].page_content)) for i in duplicates
+        )
+        self.dedup_stats["duplicate_chunks"] = len(duplicates)
+        self.dedup_stats["duplicate_tokens"] = removed_tokens
+        
+        print(f"🧹 Limpieza: {self.dedup_stats['header_footer_lines']} líneas de encabezado/pie, "
+              f"{len(duplicates)} chunks duplicados ({removed_tokens} tokens) eliminados")
+        
+        return [doc for i, doc in enumerate(documents) if i not in duplicates]
@@ -0,0 +1,135 @@
+# health.py - Sondas de salud concurrentes con timeout por sonda
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+from concurrency import SingleFlight
+from config import Config
+
+def probe_config(timeout: float) -> str:
+    errors = Config().validate_keys()
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return "API keys configuradas"
+
+def probe_documents(timeout: float) -> str:
+    folder = Config().DOCUMENTS_FOLDER
+    if not os.path.isdir(folder):
+        raise RuntimeError(f"Carpeta {folder} no existe")
+    pdf_count = sum(1 for filename in os.listdir(folder) if filename.lower().endswith('.pdf'))
+    if not pdf_count:
+        raise RuntimeError("No hay documentos PDF en la carpeta")
+    return f"{pdf_count} documentos PDF"
+
+def probe_vector_store(timeout: float) -> str:
+    config = Config()
+    # Se comprueba la versión del índice que sirve las consultas
+    from index_versions import ActiveIndexPointer, PineconeIndexPointer
+
+    if config.VECTOR_BACKEND == "local":
+        from ivf_index import LocalIVFVectorStore
+        namespace = ActiveIndexPointer(config.ACTIVE_INDEX_PATH).namespace()
+        if not os.path.exists(os.path.join(config.LOCAL_INDEX_FOLDER, namespace, LocalIVFVectorStore.INDEX_FILE)):
+            raise RuntimeError("Índice local no encontrado")
+        return "Índice local disponible"
+
+    # Consulta directa al índice, sin crear un VectorStoreManager completo
+    from http_clients import get_pinecone_client
+    index = get_pinecone_client(config.PINECONE_API_KEY).Index(config.INDEX_NAME)
+    pointer = PineconeIndexPointer(index, config.EMBEDDING_DIMENSIONS, config.ACTIVE_INDEX_PATH,
+                                   request_timeout=timeout)
+    namespace = pointer.namespace()
+    stats = index.describe_index_stats(_request_timeout=timeout)
+    total_vectors = (stats.get("namespaces") or {}).get(namespace, {}).get("vector_count", 0)
+    if not total_vectors:
+        raise RuntimeError("No hay vectores almacenados")
+    
+    # Versiones con solo ids en Pinecone: sin los textos locales no hay documentos que devolver
+    from index_versions import STORAGE_CHUNK_STORE
+    from chunk_store import ChunkStore
+    chunk_folder = os.path.join(config.CHUNK_STORE_FOLDER, namespace or "default")
+    if pointer.storage() == STORAGE_CHUNK_STORE and not ChunkStore.exists(chunk_folder):
+        raise RuntimeError(f"Faltan los textos locales de los chunks ({chunk_folder})")
+    return f"{total_vectors} vectores"
+
+def probe_openai(timeout: float) -> str:
+    # Verifica clave y conectividad sin consumir tokens
+    from openai import OpenAI
+    from http_clients import get_openai_http_client
+    config = Config()
+    client = OpenAI(api_key=config.OPENAI_API_KEY, http_client=get_openai_http_client(),
+                    timeout=timeout, max_retries=0)
+    client.models.retrieve(config.CHAT_MODEL)
+    return f"Modelo {config.CHAT_MODEL} accesible"
+
+def probe_chatbot(timeout: float) -> str:
+    # Prueba completa con una llamada real al LLM (solo en modo completo); la consulta ya está
+    # limitada por REQUEST_DEADLINE, por debajo del timeout por defecto de esta sonda
+    from rag_chatbot import RAGChatbot
+    if not RAGChatbot().test_system():
+        raise RuntimeError("La prueba del chatbot no encontró fuentes")
+    return "Prueba del chatbot exitosa"
+
+READINESS_PROBES: Dict[str, Callable[[float], str]] = {
+    "config": probe_config,
+    "documents": probe_documents,
+    "vector_store": probe_vector_store,
+    "openai": probe_openai,
+}
+
+FULL_PROBES: Dict[str, Callable[[float], str]] = dict(READINESS_PROBES, chatbot=probe_chatbot)
+
+# Las sondas que llaman a OpenAI tardan más que las locales; el resto usa HEALTH_PROBE_TIMEOUT
+PROBE_TIMEOUTS: Dict[str, float] = {
+    "openai": Config.HEALTH_OPENAI_PROBE_TIMEOUT,
+    "chatbot": Config.HEALTH_CHATBOT_PROBE_TIMEOUT,
+}
+
+# Las llamadas solapadas (p. ej. dos /ready seguidos) comparten la ejecución en curso
+# de cada sonda en lugar de lanzar otra o fallar
+_probe_flights = SingleFlight()
+
+def _execute(probe: Callable[[float], str], timeout: float) -> Dict:
+    start = time.perf_counter()
+    try:
+        result = {"ok": True, "detail": probe(timeout)}
+    except Exception as e:
+        result = {"ok": False, "detail": str(e) or type(e).__name__}
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+def run_probes(probes: Dict[str, Callable[[float], str]], timeout: Optional[float] = None) -> Dict:
+    """Ejecuta las sondas en paralelo, cada una con su timeout (o `timeout` para todas)"""
+    timeouts = {
+        name: timeout if timeout is not None else PROBE_TIMEOUTS.get(name, Config.HEALTH_PROBE_TIMEOUT)
+        for name in probes
+    }
+    results = {}
+    threads = {}
+    start = time.perf_counter()
+
+    def run(name, probe):
+        results[name] = dict(_probe_flights.do(name, _execute, probe, timeouts[name]))
+
+    # Cada sonda limita sus propias llamadas con su timeout; los hilos son daemon por si alguna
+    # se cuelga igualmente, y mientras siga colgada las nuevas llamadas esperan a la misma ejecución
+    for name, probe in probes.items():
+        threads[name] = threading.Thread(target=run, args=(name, probe), daemon=True)
+        threads[name].start()
+
+    for name, thread in threads.items():
+        thread.join(max(0.0, start + timeouts[name] - time.perf_counter()))
+
+    checks = {}
+    for name in probes:
+        checks[name] = results.get(name) or {
+            "ok": False,
+            "detail": f"Timeout tras {timeouts[name]} s",
+            "latency_ms": round(timeouts[name] * 1000, 1)
+        }
+
+    return {
+        "status": "ok" if all(check["ok"] for check in checks.values()) else "fail",
+        "checks": checks,
+        "total_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
@@ -0,0 +1,38 @@
+# http_clients.py
+import threading
+import httpx
+from pinecone import Pinecone
+from config import Config
+
+# Clientes HTTP compartidos por todo el proceso: reutilizan conexiones keep-alive
+# en lugar de abrir una nueva conexión TLS en cada llamada
+_lock = threading.Lock()
+_openai_http_client = None
+_pinecone_clients = {}
+
+def get_openai_http_client() -> httpx.Client:
+    """Cliente httpx con pool de conexiones para OpenAI (chat y embeddings)"""
+    global _openai_http_client
+    
+    with _lock:
+        if _openai_http_client is None:
+            _openai_http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=Config.HTTP_POOL_SIZE,
+                    max_keepalive_connections=Config.HTTP_POOL_SIZE,
+                    keepalive_expiry=60
+                ),
+                timeout=httpx.Timeout(Config.HTTP_TIMEOUT, connect=10)
+            )
+        return _openai_http_client
+
+def get_pinecone_client(api_key: str) -> Pinecone:
+    """Cliente de Pinecone compartido por API key"""
+    with _lock:
+        if api_key not in _pinecone_clients:
+            client = Pinecone(api_key=api_key)
+            # Tamaño del pool de conexiones urllib3 de los índices creados con client.Index()
+            # (pool_threads solo dimensiona el pool de hilos de las peticiones async_req)
+            client.openapi_config.connection_pool_maxsize = Config.HTTP_POOL_SIZE
+            _pinecone_clients[api_key] = client
+        return _pinecone_clients[api_key]
@@ -0,0 +1,162 @@
+# index_versions.py - Versión activa del índice (blue/green) con historial para rollback
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+# Dónde están los textos de los chunks de una versión
+STORAGE_METADATA = "metadata"        # en la metadata de Pinecone (versiones anteriores)
+STORAGE_CHUNK_STORE = "chunk_store"  # en textos_chunks/<namespace>; Pinecone guarda solo ids
+STORAGE_HYBRID = "chunk_store+metadata"  # en ambos: la app sin textos_chunks los pide a Pinecone
+STORAGE_LOCAL = "local"              # índice IVF local
+
+# Registro de control en el propio índice de Pinecone con el estado del puntero
+CONTROL_NAMESPACE = "_control"
+POINTER_ID = "indice_activo"
+
+def new_namespace() -> str:
+    """Nombre de namespace para una nueva versión del índice"""
+    return f"v{datetime.now(timezone.utc):%Y%m%d-%H%M%S}"
+
+class ActiveIndexPointer:
+    """Archivo que indica qué namespace sirve las consultas; se reemplaza de forma atómica
+    (solo lo ven los procesos de esta máquina: es el puntero del índice local)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cached_key = None
+        self._cached = {}
+
+    def read(self) -> dict:
+        """Estado actual ({} si nunca se hizo un cambio: se usa el namespace por defecto)"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return {}
+
+        # Solo se vuelve a leer el archivo cuando otro proceso lo ha reemplazado
+        key = (stat.st_ino, stat.st_mtime_ns)
+        with self._lock:
+            if key != self._cached_key:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._cached = json.load(f)
+                self._cached_key = key
+            return self._cached
+
+    def namespace(self) -> str:
+        return self.read().get("namespace", "")
+
+    def storage(self) -> Optional[str]:
+        """Formato de la versión activa (None si el puntero es anterior a este campo)"""
+        state = self.read()
+        if not state:
+            return STORAGE_METADATA  # namespace por defecto
+        return state.get("storage")
+
+    def _write(self, state: dict):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _entry(state: dict) -> dict:
+        """Versión del estado sin su historial"""
+        if not state:
+            # Nunca se hizo un cambio: el namespace por defecto, con el texto en la metadata
+            return {"namespace": "", "vector_count": None, "switched_at": None, "storage": STORAGE_METADATA}
+        return {k: state[k] for k in ("namespace", "vector_count", "switched_at", "storage") if k in state}
+
+    def switch(self, namespace: str, vector_count: int, keep: int = 1, storage: Optional[str] = None) -> List[str]:
+        """Activa namespace y retorna los namespaces antiguos que ya no se conservan
+
+        El namespace por defecto nunca se retorna: puede seguir sirviendo a procesos que aún
+        no ven el cambio, así que se elimina a mano si hace falta.
+        """
+        current = self.read()
+        history = [self._entry(current)] + list(current.get("history", []))
+
+        self._write({
+            "namespace": namespace,
+            "vector_count": vector_count,
+            "switched_at": datetime.now(timezone.utc).isoformat(),
+            "storage": storage,
+            "history": history[:keep]
+        })
+        return [entry["namespace"] for entry in history[keep:] if entry["namespace"]]
+
+    def rollback(self) -> Optional[dict]:
+        """Vuelve a la versión anterior; None si no hay ninguna"""
+        current = self.read()
+        history = current.get("history", [])
+        if not history:
+            return None
+
+        # La versión retirada pasa al historial: otro rollback la recupera y el próximo
+        # switch() la devuelve para eliminarla, como a cualquier versión antigua
+        previous = history[0]
+        self._write(dict(
+            previous,
+            switched_at=datetime.now(timezone.utc).isoformat(),
+            history=[self._entry(current)] + history[1:]
+        ))
+        return previous
+
+class PineconeIndexPointer(ActiveIndexPointer):
+    """Puntero guardado como registro de control en el índice de Pinecone
+
+    Lo ven todos los procesos que consultan el índice (la app desplegada y la máquina de
+    ingesta). Mientras no existe el registro se usa el archivo local de versiones anteriores.
+    """
+
+    def __init__(self, index, dimension: int, legacy_path: str, refresh_seconds: float = 10.0,
+                 request_timeout: Optional[float] = None):
+        super().__init__(legacy_path)
+        self.index = index
+        self.dimension = dimension
+        self.refresh_seconds = refresh_seconds
+        self.request_timeout = request_timeout
+        self._state = None
+        self._fetched_at = 0.0
+
+    def _fetch(self) -> dict:
+        kwargs = {"_request_timeout": self.request_timeout} if self.request_timeout else {}
+        fetched = self.index.fetch(ids=[POINTER_ID], namespace=CONTROL_NAMESPACE, **kwargs)
+        vector = (fetched.vectors or {}).get(POINTER_ID)
+        if vector is None:
+            return super().read()
+        return json.loads(vector.metadata["state"])
+
+    def read(self) -> dict:
+        """Estado actual, releído de Pinecone como mucho cada refresh_seconds"""
+        with self._lock:
+            if self._state is not None and time.monotonic() - self._fetched_at < self.refresh_seconds:
+                return self._state
+
+        try:
+            state = self._fetch()
+        except Exception as e:
+            if self._state is None:
+                raise
+            # Un fallo puntual de Pinecone no debe cortar las consultas: se sigue con lo último leído
+            print(f"⚠️  No se pudo releer la versión activa del índice: {e}")
+            state = self._state
+
+        with self._lock:
+            self._state = state
+            self._fetched_at = time.monotonic()
+            return state
+
+    def _write(self, state: dict):
+        # Pinecone no admite vectores nulos con la métrica coseno
+        values = [1.0] + [0.0] * (self.dimension - 1)
+        self.index.upsert(
+            vectors=[{"id": POINTER_ID, "values": values, "metadata": {"state": json.dumps(state, ensure_ascii=False)}}],
+            namespace=CONTROL_NAMESPACE
+        )
+        with self._lock:
+            self._state = state
+            self._fetched_at = time.monotonic()
@@ -0,0 +1,362 @@
+# ivf_index.py
+import json
+import os
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+class IVFIndex:
+    """Índice aproximado por particiones (IVF) con centroides k-means y similitud coseno"""
+
+    def __init__(self, dimension: int, nlist: int = 0, nprobe: int = 8):
+        self.dimension = dimension
+        self.target_nlist = nlist  # configurado; nlist es el efectivo tras entrenar
+        self.nlist = nlist
+        self.auto_nlist = nlist == 0  # ≈ raíz cuadrada del corpus
+        self.nprobe = nprobe
+        self.centroids = None
+        self.trained_size = 0
+
+        # Listas invertidas: vectores e ids de cada partición
+        self.list_vectors: List[np.ndarray] = []
+        self.list_ids: List[List[str]] = []
+        self.id_to_list: Dict[str, int] = {}
+        self._positions: Optional[Dict[str, Tuple[int, int]]] = None  # id -> (partición, fila), bajo demanda
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self.id_to_list)
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 4096) -> np.ndarray:
+        """Asigna cada vector a su centroide más cercano, por lotes para acotar memoria"""
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch_size):
+            batch = vectors[start:start + batch_size]
+            assignments[start:start + batch_size] = np.argmax(batch @ self.centroids.T, axis=1)
+        return assignments
+
+    def train(self, vectors, iterations: int = 20, batch_size: int = 4096, seed: int = 0):
+        """Entrena los centroides con k-means esférico sobre una muestra de los vectores"""
+        vectors = self._normalize(vectors)
+        nlist = max(1, int(np.sqrt(len(vectors)))) if self.auto_nlist else self.target_nlist
+        # Con pocos vectores se usan menos particiones, sin perder el valor configurado
+        nlist = min(nlist, len(vectors))
+
+        rng = np.random.default_rng(seed)
+        # Con ~256 puntos por partición los centroides ya son estables
+        max_train = 256 * nlist
+        if len(vectors) > max_train:
+            vectors = vectors[rng.choice(len(vectors), max_train, replace=False)]
+
+        self.centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = self._assign(vectors, batch_size)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignments, vectors)
+            counts = np.bincount(assignments, minlength=nlist)
+
+            # Las particiones vacías se re-siembran con puntos aleatorios
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+            self.centroids = self._normalize(sums)
+
+        self.nlist = nlist
+        self.trained_size = len(vectors)
+        self.list_vectors = [np.empty((0, self.dimension), dtype=np.float32) for _ in range(nlist)]
+        self.list_ids = [[] for _ in range(nlist)]
+        self.id_to_list = {}
+        self._positions = None
+
+    def add(self, ids: List[str], vectors, batch_size: int = 4096):
+        """Añade (o reemplaza) vectores en sus particiones"""
+        if not self.is_trained:
+            raise RuntimeError("El índice IVF debe entrenarse antes de añadir vectores")
+
+        vectors = self._normalize(vectors)
+        existing = [vector_id for vector_id in ids if vector_id in self.id_to_list]
+        if existing:
+            self.remove(existing)
+
+        assignments = self._assign(vectors, batch_size)
+        self._positions = None
+        for list_no in np.unique(assignments):
+            rows = np.flatnonzero(assignments == list_no)
+            self.list_vectors[list_no] = np.vstack([self.list_vectors[list_no], vectors[rows]])
+            for row in rows:
+                self.list_ids[list_no].append(ids[row])
+                self.id_to_list[ids[row]] = int(list_no)
+
+    def remove(self, ids: Iterable[str]):
+        """Elimina vectores por id"""
+        by_list: Dict[int, set] = {}
+        self._positions = None
+        for vector_id in ids:
+            list_no = self.id_to_list.pop(vector_id, None)
+            if list_no is not None:
+                by_list.setdefault(list_no, set()).add(vector_id)
+
+        for list_no, removed in by_list.items():
+            keep = [i for i, vector_id in enumerate(self.list_ids[list_no]) if vector_id not in removed]
+            self.list_vectors[list_no] = self.list_vectors[list_no][keep]
+            self.list_ids[list_no] = [self.list_ids[list_no][i] for i in keep]
+
+    def needs_retrain(self) -> bool:
+        """Indica si el corpus creció tanto que conviene re-entrenar los centroides"""
+        if not self.is_trained:
+            return False
+        if self.auto_nlist:
+            return len(self) > 4 * self.nlist ** 2
+        return self.trained_size < 256 * self.target_nlist and len(self) > 4 * self.trained_size
+
+    def rebuild(self):
+        """Re-entrena los centroides con todos los vectores actuales y los redistribuye"""
+        ids = [vector_id for list_ids in self.list_ids for vector_id in list_ids]
+        vectors = np.vstack(self.list_vectors)
+        self.train(vectors)
+        self.add(ids, vectors)
+
+    def search(self, query, k: int = 4, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Busca los k vectores más similares explorando las nprobe particiones más cercanas"""
+        if not self.is_trained or not len(self):
+            return []
+
+        query = self._normalize(query)[0]
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        probes = [list_no for list_no in probes if len(self.list_ids[list_no])]
+        if not probes:
+            return []
+
+        candidates = np.vstack([self.list_vectors[list_no] for list_no in probes])
+        candidate_ids = [vector_id for list_no in probes for vector_id in self.list_ids[list_no]]
+
+        scores = candidates @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [(candidate_ids[i], float(scores[i])) for i in top]
+
+    def search_ids(self, query, ids: List[str], k: int = 4) -> List[Tuple[str, float]]:
+        """Búsqueda exacta restringida a un subconjunto de ids (coste proporcional al subconjunto)"""
+        if self._positions is None:
+            self._positions = {
+                vector_id: (list_no, row)
+                for list_no, list_ids in enumerate(self.list_ids)
+                for row, vector_id in enumerate(list_ids)
+            }
+
+        positions = [(vector_id, self._positions[vector_id]) for vector_id in ids if vector_id in self._positions]
+        if not positions:
+            return []
+
+        query = self._normalize(query)[0]
+        candidates = np.vstack([self.list_vectors[list_no][row] for _, (list_no, row) in positions])
+        scores = candidates @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [(positions[i][0], float(scores[i])) for i in top]
+
+    def save(self, path: str):
+        """Guarda el índice en un archivo .npz"""
+        sizes = np.array([len(list_ids) for list_ids in self.list_ids], dtype=np.int64)
+        np.savez(
+            path,
+            centroids=self.centroids,
+            vectors=np.vstack(self.list_vectors),
+            list_sizes=sizes,
+            ids=np.array([vector_id for list_ids in self.list_ids for vector_id in list_ids], dtype=str),
+            params=np.array(
+                [self.dimension, self.nlist, self.nprobe, self.trained_size, int(self.auto_nlist),
+                 self.target_nlist],
+                dtype=np.int64
+            )
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        """Carga un índice guardado con save()"""
+        data = np.load(path)
+        params = [int(v) for v in data["params"]]
+        dimension, nlist, nprobe, trained_size, auto_nlist = params[:5]
+        # Los índices guardados antes de separar el nlist configurado del efectivo no lo incluyen
+        target_nlist = params[5] if len(params) > 5 else (0 if auto_nlist else nlist)
+
+        index = cls(dimension, target_nlist, nprobe)
+        index.nlist = nlist
+        index.auto_nlist = bool(auto_nlist)
+        index.centroids = data["centroids"]
+        index.trained_size = trained_size
+
+        offsets = np.concatenate([[0], np.cumsum(data["list_sizes"])])
+        vectors, ids = data["vectors"], data["ids"].tolist()
+
+        for list_no in range(nlist):
+            start, end = offsets[list_no], offsets[list_no + 1]
+            index.list_vectors.append(vectors[start:end])
+            index.list_ids.append(ids[start:end])
+            for vector_id in ids[start:end]:
+                index.id_to_list[vector_id] = list_no
+
+        return index
+
+class LocalIVFVectorStore(VectorStore):
+    """Vector store de LangChain respaldado por un IVFIndex persistido en disco"""
+
+    INDEX_FILE = "ivf_index.npz"
+    DOCUMENTS_FILE = "documents.json"
+
+    def __init__(self, embedding: Embeddings, folder: str, dimension: int, nlist: int = 0, nprobe: int = 8):
+        self.embedding = embedding
+        self.folder = folder
+        self.index = IVFIndex(dimension, nlist, nprobe)
+        self.documents: Dict[str, dict] = {}
+        self._section_ids: Optional[Dict[str, List[str]]] = None  # section_id -> ids, bajo demanda
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @classmethod
+    def load_or_create(cls, embedding: Embeddings, folder: str, dimension: int,
+                       nlist: int = 0, nprobe: int = 8) -> "LocalIVFVectorStore":
+        """Carga el índice local si existe o crea uno vacío"""
+        store = cls(embedding, folder, dimension, nlist, nprobe)
+        index_path = os.path.join(folder, cls.INDEX_FILE)
+
+        if os.path.exists(index_path):
+            store.index = IVFIndex.load(index_path)
+            store.index.nprobe = nprobe
+            if store.index.dimension != dimension:
+                raise ValueError(
+                    f"El índice local tiene dimensión {store.index.dimension} "
+                    f"pero EMBEDDING_DIMENSIONS={dimension}"
+                )
+            with open(os.path.join(folder, cls.DOCUMENTS_FILE), "r", encoding="utf-8") as f:
+                store.documents = json.load(f)
+
+        return store
+
+    def save(self):
+        """Persiste el índice y los textos de los documentos"""
+        os.makedirs(self.folder, exist_ok=True)
+        if self.index.is_trained:
+            self.index.save(os.path.join(self.folder, self.INDEX_FILE))
+        with open(os.path.join(self.folder, self.DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.documents, f, ensure_ascii=False)
+
+    def clear(self):
+        """Elimina todos los vectores del índice local"""
+        self.index = IVFIndex(self.index.dimension, self.index.target_nlist, self.index.nprobe)
+        self.documents = {}
+        self._section_ids = None
+        # Solo los archivos propios: la carpeta puede contener otras versiones del índice
+        for filename in (self.INDEX_FILE, self.DOCUMENTS_FILE):
+            path = os.path.join(self.folder, filename)
+            if os.path.exists(path):
+                os.remove(path)
+        try:
+            os.rmdir(self.folder)
+        except OSError:
+            pass
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+
+        if not self.index.is_trained:
+            self.index.train(vectors)
+        self.index.add(ids, vectors)
+        if self.index.needs_retrain():
+            print("🔄 Re-entrenando particiones del índice local...")
+            self.index.rebuild()
+
+        for vector_id, text, metadata in zip(ids, texts, metadatas):
+            self.documents[vector_id] = {"text": text, "metadata": metadata}
+        self._section_ids = None
+
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs) -> Optional[bool]:
+        if ids:
+            self.index.remove(ids)
+            for vector_id in ids:
+                self.documents.pop(vector_id, None)
+            self._section_ids = None
+        return True
+
+    def _ids_for_filter(self, filter: dict) -> List[str]:
+        """Ids de los chunks que cumplen un filtro {"section_id": {"$in": [...]}} (como en Pinecone)"""
+        if set(filter) != {"section_id"} or set(filter["section_id"]) != {"$in"}:
+            raise ValueError(f"Filtro no soportado por el índice local: {filter}")
+
+        if self._section_ids is None:
+            self._section_ids = {}
+            for vector_id, stored in self.documents.items():
+                section_id = stored["metadata"].get("section_id")
+                if section_id is not None:
+                    self._section_ids.setdefault(section_id, []).append(vector_id)
+
+        return [
+            vector_id
+            for section_id in filter["section_id"]["$in"]
+            for vector_id in self._section_ids.get(section_id, [])
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k, **kwargs)
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None, **kwargs) -> List[Tuple[Document, float]]:
+        if filter:
+            matches = self.index.search_ids(embedding, self._ids_for_filter(filter), k=k)
+        else:
+            matches = self.index.search(embedding, k=k, nprobe=kwargs.get("nprobe"))
+        results = []
+
+        for vector_id, score in matches:
+            stored = self.documents.get(vector_id)
+            if stored:
+                results.append((Document(page_content=stored["text"], metadata=stored["metadata"]), score))
+
+        return results
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # La puntuación ya es similitud coseno
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   folder: str = "indice_local", dimension: int = 1536, **kwargs) -> "LocalIVFVectorStore":
+        store = cls.load_or_create(embedding, folder, dimension, kwargs.get("nlist", 0), kwargs.get("nprobe", 8))
+        store.add_texts(texts, metadatas)
+        store.save()
+        return store
@@ -0,0 +1,367 @@
+# load_test.py - Prueba de carga del chatbot con sustitutos locales de OpenAI y Pinecone
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import tracemalloc
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import uuid
+from typing import Iterator, List, Tuple
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.vectorstores import VectorStore
+from config import Config
+from metrics import latency_summary
+from rag_chatbot import RAGChatbot
+
+# Preguntas habituales; la popularidad sigue una ley de Zipf (unas pocas se repiten mucho)
+DEFAULT_QUESTIONS = [
+    "¿Cuáles son los puntos principales de estos documentos?",
+    "¿Qué regulación existe para los suplementos alimenticios en México?",
+    "¿Qué es la alfabetización en autocuidado?",
+    "¿Qué declaraciones de propiedades saludables están permitidas?",
+    "¿Cómo se regulan los probióticos en Brasil?",
+    "¿Qué límites máximos de vitaminas y minerales se establecen?",
+    "Resume el estudio de suplementos alimenticios en Latinoamérica",
+    "¿Qué países tienen registro sanitario obligatorio para suplementos?",
+    "¿Qué recomendaciones se hacen a los gobiernos sobre autocuidado?",
+    "¿Qué requisitos de etiquetado aplican en Colombia?",
+    "¿Cuál es el tamaño del mercado de suplementos en la región?",
+    "¿Qué diferencias hay entre suplemento y medicamento?",
+]
+
+def lognormal(rng: random.Random, median: float, sigma: float) -> float:
+    """Latencia con cola larga: mediana fija y dispersión sigma"""
+    return median * rng.lognormvariate(0.0, sigma)
+
+class SimulatedLatency:
+    """Distribuciones de latencia de los servicios externos (segundos, escalables)"""
+
+    def __init__(self, scale: float = 1.0, seed: int = 0):
+        self.scale = scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, median: float, sigma: float) -> float:
+        with self._lock:
+            return lognormal(self._rng, median, sigma) * self.scale
+
+    def sleep(self, median: float, sigma: float):
+        time.sleep(self.sample(median, sigma))
+
+class SimulatedEmbeddings(Embeddings):
+    """Embeddings deterministas (bolsa de palabras con hashing) con la latencia de OpenAI"""
+
+    def __init__(self, latency: SimulatedLatency, dimension: int = 1536):
+        self.latency = latency
+        self.dimension = dimension
+
+    def vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in re.findall(r"\w{4,}", text.lower()):
+            vector[zlib.crc32(word.encode("utf-8")) % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.vector(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.latency.sleep(median=0.15, sigma=0.5)
+        return self.vector(text).tolist()
+
+class SimulatedIndex:
+    """Sustituto del índice remoto de Pinecone: corpus compartido por todas las sesiones"""
+
+    def __init__(self, dimension: int):
+        self.documents: List[Document] = []
+        self.ids: List[str] = []
+        self.matrix = np.empty((0, dimension), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, documents: List[Document]):
+        with self._lock:
+            self.ids = self.ids + ids
+            self.documents = self.documents + documents
+            self.matrix = np.vstack([self.matrix, vectors])
+
+    def query(self, vector, k: int) -> List[Tuple[Document, float]]:
+        # Lista y matriz se reemplazan juntas al insertar: se leen una sola vez
+        documents, matrix = self.documents, self.matrix
+        scores = matrix[:len(documents)] @ np.asarray(vector, dtype=np.float32)
+        top = np.argsort(-scores)[:k]
+        # La bolsa de palabras da similitudes bajas; se llevan al rango típico de text-embedding-3
+        return [(documents[i], 0.3 + 0.6 * float(scores[i])) for i in top]
+
+class SimulatedVectorStore(VectorStore):
+    """Vector store de una sesión sobre el índice compartido, con la latencia de una consulta a Pinecone"""
+
+    def __init__(self, index: SimulatedIndex, embedding: SimulatedEmbeddings, latency: SimulatedLatency):
+        self.index = index
+        self.embedding = embedding
+        self.latency = latency
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32).reshape(len(texts), -1)
+        self.index.upsert(ids, vectors, [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)])
+        return ids
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               **kwargs) -> List[Tuple[Document, float]]:
+        self.latency.sleep(median=0.06, sigma=0.6)
+        return self.index.query(embedding, k)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, latency: SimulatedLatency,
+                   index: SimulatedIndex = None, **kwargs) -> "SimulatedVectorStore":
+        store = cls(index or SimulatedIndex(embedding.dimension), embedding, latency)
+        store.add_texts(texts, metadatas=metadatas)
+        return store
+
+class SimulatedVectorStoreManager:
+    """Sustituto de VectorStoreManager con la interfaz que usa RAGChatbot (uno por sesión, como en la app)"""
+
+    def __init__(self, index: SimulatedIndex, latency: SimulatedLatency):
+        # Cada sesión tiene su propio cliente de embeddings y vector store; el índice es remoto y compartido
+        self.vector_store = SimulatedVectorStore(index, SimulatedEmbeddings(latency, index.matrix.shape[1]), latency)
+
+    def get_vector_store(self):
+        return self.vector_store
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.vector_store.embedding.embed_query(query)
+
+    def search_by_vector(self, query_vector: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        return self.vector_store.similarity_search_by_vector_with_score(query_vector, k=k)
+
+    def search_with_scores(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        return self.search_by_vector(self.embed_query(query), k=k)
+
+    def search_similar_documents(self, query: str, k: int = 4) -> List[Document]:
+        return [doc for doc, _ in self.search_with_scores(query, k=k)]
+
+    def get_index_stats(self) -> dict:
+        return {"total_vectors": len(self.vector_store.index.documents), "dimension": self.vector_store.embedding.dimension}
+
+class SimulatedChatModel(BaseChatModel):
+    """Modelo de chat con tiempo hasta el primer token y velocidad de generación realistas"""
+
+    latency: SimulatedLatency
+    tokens_per_second: float = 60.0
+    mean_output_tokens: int = 180
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = "".join(chunk.message.content for chunk in self._stream(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        prompt_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = max(20, int(self.latency.sample(self.mean_output_tokens, 0.3) / self.latency.scale))
+
+        # El prefill crece con el prompt; la cola larga está sobre todo en el primer token
+        self.latency.sleep(median=0.5 + prompt_tokens / 20000, sigma=0.7)
+        for _ in range(output_tokens // 10):
+            time.sleep(10 / self.tokens_per_second * self.latency.scale)
+            yield ChatGenerationChunk(message=AIMessageChunk(content="palabra " * 8))
+
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata={
+            "input_tokens": prompt_tokens, "output_tokens": output_tokens,
+            "total_tokens": prompt_tokens + output_tokens
+        }))
+
+def load_corpus(synthetic_chunks: int) -> List[Document]:
+    """Chunks reales de documentos/ (desde la caché de texto) o sintéticos si no hay PDFs"""
+    if not synthetic_chunks:
+        from document_processor import DocumentProcessor
+        documents = DocumentProcessor().process_documents()
+        if documents:
+            return documents
+
+    rng = random.Random(1)
+    words = [word for question in DEFAULT_QUESTIONS for word in re.findall(r"\w{4,}", question.lower())]
+    return [
+        Document(
+            page_content=" ".join(rng.choice(words) for _ in range(180)),
+            metadata={"source": f"sintetico-{i // 50}.pdf", "chunk_id": i % 50}
+        )
+        for i in range(synthetic_chunks or 500)
+    ]
+
+class Session:
+    """Una sesión de la app: su propio RAGChatbot (con su VectorStoreManager y LLM) e historial"""
+
+    def __init__(self, session_id: str, index: SimulatedIndex, latency: SimulatedLatency):
+        self.session_id = session_id
+        self.chatbot = RAGChatbot(
+            vector_manager=SimulatedVectorStoreManager(index, latency),
+            llm=SimulatedChatModel(latency=latency)
+        )
+        self.chatbot.setup_retrieval_chain()
+        self.messages = []
+        self.lock = threading.Lock()
+
+    def ask(self, question: str) -> dict:
+        result = self.chatbot.chat(question, user_id=self.session_id)
+        with self.lock:
+            self.messages.append({"role": "user", "content": question})
+            self.messages.append({"role": "assistant", "content": result["answer"], "sources": result["sources"]})
+        return result
+
+def run_load(sessions: List[Session], questions: List[str], rate: float, duration: float,
+             seed: int = 0, max_in_flight: int = 512) -> dict:
+    """Llegadas de Poisson a `rate` consultas/s durante `duration` s, repartidas entre sesiones"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(questions))]
+    results = []
+    results_lock = threading.Lock()
+
+    def request(session: Session, question: str, scheduled: float):
+        # La latencia se mide desde la llegada prevista: incluye cualquier espera en el generador
+        try:
+            result = session.ask(question)
+            status = "partial" if result.get("partial") else "degraded" if result.get("degraded") else \
+                "ok" if result["success"] else "error"
+        except Exception:
+            status = "error"
+        with results_lock:
+            results.append((status, time.perf_counter() - scheduled, time.perf_counter()))
+
+    start = time.perf_counter()
+    arrivals = 0
+    next_arrival = start
+
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="usuario") as executor:
+        while True:
+            next_arrival += rng.expovariate(rate)
+            if next_arrival - start > duration:
+                break
+            time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            session = rng.choice(sessions)
+            question = rng.choices(questions, weights=weights)[0]
+            executor.submit(request, session, question, next_arrival)
+            arrivals += 1
+
+    elapsed = time.perf_counter() - start
+    latencies = [latency for _, latency, _ in results]
+    statuses = {}
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    return {
+        "arrivals": arrivals,
+        "completed": len(results),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(results) / elapsed if elapsed else 0.0,
+        "statuses": statuses,
+        "error_rate": statuses.get("error", 0) / len(results) if results else 0.0,
+        "latency": latency_summary(latencies)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de RAGChatbot con OpenAI y Pinecone simulados")
+    parser.add_argument("--rate", type=float, default=5.0, help="Consultas por segundo (llegadas de Poisson)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Segundos generando carga")
+    parser.add_argument("--sessions", type=int, default=50, help="Sesiones simultáneas de la app")
+    parser.add_argument("--questions", help="Archivo con una pregunta por línea (por defecto, una mezcla típica)")
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Multiplica todas las latencias simuladas (<1 para pruebas rápidas)")
+    parser.add_argument("--synthetic-chunks", type=int, default=0,
+                        help="Usa N chunks sintéticos en vez de los PDFs de documentos/")
+    parser.add_argument("--output", help="Guarda el informe en JSON")
+    args = parser.parse_args()
+
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    # Los plazos y esperas del chatbot se escalan como las latencias simuladas
+    # (si no, una ejecución acelerada nunca llegaría a duplicar peticiones ni a agotar plazos)
+    for setting in ("REQUEST_DEADLINE", "EMBEDDING_TIMEOUT", "SEARCH_TIMEOUT",
+                    "LLM_HEDGE_DEFAULT_DELAY", "LLM_HEDGE_MIN_DELAY"):
+        setattr(Config, setting, getattr(Config, setting) * args.latency_scale)
+
+    corpus = load_corpus(args.synthetic_chunks)
+    latency = SimulatedLatency(args.latency_scale)
+    index = SimulatedVectorStore.from_texts(
+        [doc.page_content for doc in corpus],
+        SimulatedEmbeddings(latency, Config.EMBEDDING_DIMENSIONS),
+        metadatas=[doc.metadata for doc in corpus],
+        latency=latency
+    ).index
+
+    print(f"👥 Creando {args.sessions} sesiones sobre {len(corpus)} chunks...")
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    sessions = [Session(f"sesion-{i}", index, latency) for i in range(args.sessions)]
+    idle_memory = tracemalloc.get_traced_memory()[0] - baseline
+
+    print(f"🚀 {args.rate} consultas/s durante {args.duration:.0f} s "
+          f"(máx. {Config.LLM_MAX_CONCURRENT} llamadas simultáneas al LLM)...")
+    report = run_load(sessions, questions, args.rate, args.duration)
+
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    system = sessions[0].chatbot.get_system_stats()
+
+    report.update({
+        "sessions": args.sessions,
+        "memory_per_session_kb": {
+            "idle": idle_memory / args.sessions / 1024,
+            "after_load": (current - baseline) / args.sessions / 1024
+        },
+        "memory_peak_mb": (peak - baseline) / 1024**2,
+        "llm_queue": system["llm_queue"],
+        "coalesced_requests": system["coalesced_requests"],
+        "tail": {key: value for key, value in system["requests"].items() if key != "latency"}
+    })
+
+    lat = report["latency"]
+    queue = report["llm_queue"]
+    print(f"\n📊 Resultados")
+    print(f"  Consultas: {report['completed']}/{report['arrivals']} en {report['elapsed_s']:.1f} s "
+          f"({report['throughput_rps']:.2f} consultas/s)")
+    print(f"  Estados: {report['statuses']} (errores: {report['error_rate']:.1%})")
+    print(f"  Latencia (s): p50 {lat['p50']:.2f} · p90 {lat['p90']:.2f} · p95 {lat['p95']:.2f} · "
+          f"p99 {lat['p99']:.2f} · máx {lat['max']:.2f}")
+    print(f"  Cola del LLM: espera p50 {queue['queue_wait_p50']:.2f} s · p95 {queue['queue_wait_p95']:.2f} s · "
+          f"rechazadas {queue['rejected']} · agotadas {queue['timed_out']}")
+    print(f"  Preguntas agrupadas: {report['coalesced_requests']} · Cola larga: {report['tail']}")
+    print(f"  Memoria por sesión: {report['memory_per_session_kb']['idle']:.1f} KB en reposo, "
+          f"{report['memory_per_session_kb']['after_load']:.1f} KB tras la carga "
+          f"(pico total {report['memory_peak_mb']:.1f} MB)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Informe guardado en {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# metrics.py
+import math
+import threading
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por rango más cercano (pct entre 0 y 100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    """Resumen de latencias en segundos: media y percentiles habituales"""
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values)
+    }
+
+class LLMUsageTracker:
+    """Acumula tokens de entrada, tokens servidos desde la caché de prompts y tiempos del LLM"""
+    
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self._latencies = deque(maxlen=window)
+        self._first_token_times = deque(maxlen=window)
+    
+    def record(self, usage: Dict[str, int], latency: float, first_token: float = None):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.cached_tokens += usage.get("cached_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+            self._latencies.append(latency)
+            if first_token is not None:
+                self._first_token_times.append(first_token)
+    
+    def first_token_percentile(self, pct: float, min_samples: int) -> Optional[float]:
+        """Percentil reciente del tiempo hasta el primer token (None con menos de min_samples)"""
+        with self._lock:
+            if len(self._first_token_times) < min_samples:
+                return None
+            return percentile(list(self._first_token_times), pct)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cache_hit_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                "completion_tokens": self.completion_tokens,
+                "latency": latency_summary(list(self._latencies)),
+                "time_to_first_token": latency_summary(list(self._first_token_times))
+            }
+
+class RequestTracker:
+    """Latencia de extremo a extremo de las consultas y eventos de cola larga (hedging, plazos agotados)"""
+    
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._events = Counter()
+    
+    def record(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+    
+    def count(self, event: str):
+        with self._lock:
+            self._events[event] += 1
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"latency": latency_summary(list(self._latencies)), **self._events}
@@ -0,0 +1,37 @@
+# migrate_dimensions.py
+import argparse
+from config import index_name_for_dimensions, DEFAULT_EMBEDDING_DIMENSIONS
+from vector_store import VectorStoreManager
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Migra un índice existente a la dimensión EMBEDDING_DIMENSIONS configurada"
+    )
+    parser.add_argument(
+        "--from-dimensions",
+        type=int,
+        default=DEFAULT_EMBEDDING_DIMENSIONS,
+        help="Dimensión del índice de origen (por defecto 1536)"
+    )
+    args = parser.parse_args()
+    
+    source_index_name = index_name_for_dimensions(args.from_dimensions)
+    
+    print("🚀 Iniciando migración de dimensiones...")
+    vector_manager = VectorStoreManager()
+    
+    if source_index_name == vector_manager.config.INDEX_NAME:
+        print("⚠️  El índice de origen y destino son el mismo. Define EMBEDDING_DIMENSIONS en el .env")
+        return
+    
+    migrated = vector_manager.migrate_from_index(source_index_name)
+    
+    if migrated:
+        stats = vector_manager.get_index_stats()
+        print(f"📊 Vectores en '{vector_manager.config.INDEX_NAME}': {stats.get('total_vectors', 0)}")
+        print(f"💡 Cuando verifiques el nuevo índice puedes eliminar '{source_index_name}'")
+    else:
+        print("❌ No se migraron vectores")
+
+if __name__ == "__main__":
+    main()
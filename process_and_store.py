@@ -1,6 +1,27 @@
 # process_and_store.py
+import argparse
+import os
 from document_processor import DocumentProcessor
 from vector_store import VectorStoreManager
+from snapshot import build_snapshot, write_snapshot
+from index_versions import new_namespace
+from profiling import get_profiler
+from config import Config
+
+def rollback():
+    """Vuelve a servir la versión anterior del índice"""
+    config = Config()
+    previous = VectorStoreManager().pointer.rollback()
+    
+    if previous is None:
+        print("❌ No hay una versión anterior a la que volver")
+        return
+    
+    # El snapshot describe la versión retirada: sin él la app consulta el índice directamente
+    if os.path.exists(config.SNAPSHOT_PATH):
+        os.remove(config.SNAPSHOT_PATH)
+    print(f"⏪ Versión activa: '{previous['namespace'] or 'por defecto'}'")
+    print("💡 La versión retirada se conserva hasta la próxima ingesta (--rollback de nuevo la recupera)")
 
 def main():
     print("🚀 Iniciando procesamiento de documentos...")
@@ -14,18 +35,25 @@ def main():
         print("❌ No se procesaron documentos. Verifica que tengas PDFs en la carpeta 'documentos'")
         return
     
-    # 2. Almacenar en base vectorial
-    print("\n🗄️ Paso 2: Almacenando en base vectorial...")
-    vector_manager = VectorStoreManager()
+    # 2. Almacenar en una versión nueva del índice; el chatbot sigue sirviendo la actual
+    namespace = new_namespace()
+    print(f"\n🗄️ Paso 2: Almacenando en base vectorial (versión '{namespace}')...")
+    vector_manager = VectorStoreManager(namespace=namespace)
     success = vector_manager.store_documents(documents)
     
     if success:
-        # 3. Verificar almacenamiento
+        # 3. Verificar almacenamiento antes de activar la versión
         print("\n📊 Paso 3: Verificando almacenamiento...")
+        stored = vector_manager.wait_for_vector_count(len(documents), vector_manager.config.REINDEX_VALIDATE_TIMEOUT)
         stats = vector_manager.get_index_stats()
-        print(f"✅ Total de vectores almacenados: {stats.get('total_vectors', 0)}")
+        print(f"✅ Total de vectores almacenados: {stored} de {len(documents)}")
         print(f"✅ Dimensión de vectores: {stats.get('dimension', 0)}")
         
+        if stored != len(documents):
+            print(f"❌ La versión '{namespace}' está incompleta; se sigue sirviendo la versión actual")
+            vector_manager.delete_namespace(namespace)
+            return
+        
         # 4. Prueba rápida de búsqueda
         print("\n🔍 Paso 4: Prueba de búsqueda...")
         test_query = "¿Qué información contienen estos documentos?"
@@ -38,13 +66,48 @@ def main():
                 preview = doc.page_content[:100] + "..."
                 print(f"  {i}. 📄 {source}: {preview}")
         else:
-            print("⚠️  No se encontraron resultados en la búsqueda de prueba")
+            print("❌ La búsqueda de prueba falló; se sigue sirviendo la versión actual")
+            vector_manager.delete_namespace(namespace)
+            return
+        
+        # 5. Cambio atómico de la versión servida
+        print("\n🔀 Paso 5: Activando la nueva versión...")
+        retired = vector_manager.pointer.switch(namespace, stored, keep=vector_manager.config.INDEX_VERSIONS_KEPT,
+                                 storage=vector_manager.storage_format())
+        print(f"✅ Versión '{namespace}' activa (rollback: python process_and_store.py --rollback)")
+        for old_namespace in retired:
+            vector_manager.delete_namespace(old_namespace)
+        
+        # Snapshot para que la app arranque sin listar archivos ni consultar Pinecone
+        snapshot = build_snapshot(processor.document_stats, stats, vector_manager.config)
+        write_snapshot(snapshot, vector_manager.config.SNAPSHOT_PATH)
+        print(f"✅ Snapshot {snapshot['ingest_version']} guardado en {vector_manager.config.SNAPSHOT_PATH}")
         
         print("\n🎉 ¡Procesamiento completado exitosamente!")
         print("💡 Ya puedes usar el chatbot con estos documentos")
     
     else:
-        print("❌ Error en el almacenamiento")
+        # Sin esto la versión a medio escribir quedaría huérfana en Pinecone y en disco
+        print(f"❌ Error en el almacenamiento; se elimina la versión incompleta '{namespace}'")
+        vector_manager.delete_namespace(namespace)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Procesa los PDFs en una versión nueva del índice y la activa")
+    parser.add_argument("--rollback", action="store_true", help="Vuelve a la versión anterior del índice")
+    parser.add_argument("--profile", action="store_true",
+                        help="Mide memoria y CPU por etapa y guarda el informe en PROFILE_FOLDER")
+    args = parser.parse_args()
+    
+    if args.rollback:
+        rollback()
+    else:
+        profiler = get_profiler()
+        if args.profile:
+            profiler.enable()
+        try:
+            main()
+        finally:
+            # También si la ingesta falla: el informe muestra hasta qué etapa llegó
+            if profiler.enabled:
+                report_path = profiler.export(Config.PROFILE_FOLDER, "ingesta")
+                print(f"🧠 Informe de perfilado guardado en {report_path}")
@@ -0,0 +1,296 @@
+# profiling.py - Perfilado opcional de memoria y CPU por etapa, con informes comparables entre ejecuciones
+import argparse
+import cProfile
+import functools
+import io
+import json
+import os
+import platform
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from config import Config
+
+PROFILE_FORMAT = 1
+
+def deep_size(obj, seen: Optional[set] = None) -> int:
+    """Bytes ocupados por un objeto y todo lo que contiene (cada objeto se cuenta una vez)"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += deep_size(vars(obj), seen)
+    return size
+
+class _StageFrame:
+    def __init__(self, name: str):
+        self.name = name
+        self.start_memory = 0
+        self.peak = 0
+
+class Profiler:
+    """Tiempos, picos de memoria y perfiles de CPU muestreados por etapa (desactivado por defecto)"""
+
+    def __init__(self, sample_rate: float = 0.1, top_allocations: int = 15, top_functions: int = 20):
+        self.sample_rate = sample_rate
+        self.top_allocations = top_allocations
+        self.top_functions = top_functions
+        self.enabled = False
+
+        self._lock = threading.Lock()
+        # cProfile solo admite un perfil activo a la vez: las muestras que coinciden se omiten
+        self._cpu_lock = threading.Lock()
+        self._open_frames = set()
+        self._rng = random.Random()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages: Dict[str, dict] = {}
+            self.cpu: Dict[str, pstats.Stats] = {}
+            self.cpu_samples: Dict[str, int] = {}
+            self.allocations: Dict[str, List[dict]] = {}
+            self.sessions: Dict[str, dict] = {}
+            self.started_at = datetime.now(timezone.utc)
+
+    def enable(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str, sample: Optional[float] = None, snapshot: bool = False):
+        """Mide una etapa: tiempo, pico de memoria, asignaciones principales y (a veces) perfil de CPU"""
+        if not self.enabled:
+            yield
+            return
+
+        frame = _StageFrame(name)
+        with self._lock:
+            # Antes de reiniciar el pico se traslada a todas las etapas abiertas (anidadas o en otros hilos)
+            current, peak = tracemalloc.get_traced_memory()
+            for open_frame in self._open_frames:
+                open_frame.peak = max(open_frame.peak, peak)
+            tracemalloc.reset_peak()
+            frame.start_memory = current
+            self._open_frames.add(frame)
+
+        sample = self.sample_rate if sample is None else sample
+        profile = None
+        if sample and self._rng.random() < sample and self._cpu_lock.acquire(blocking=False):
+            profile = cProfile.Profile()
+            profile.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                self._cpu_lock.release()
+
+            with self._lock:
+                current, peak = tracemalloc.get_traced_memory()
+                frame.peak = max(frame.peak, peak)
+                self._open_frames.discard(frame)
+                self._record(frame, elapsed, current, profile)
+
+            if snapshot:
+                self._record_allocations(name)
+
+    def _record(self, frame: _StageFrame, elapsed: float, current: int, profile: Optional[cProfile.Profile]):
+        # Con consultas concurrentes el pico incluye lo asignado por otros hilos durante la etapa
+        stats = self.stages.setdefault(frame.name, {
+            "calls": 0, "total_s": 0.0, "max_s": 0.0, "peak_kb": 0.0, "retained_kb": 0.0
+        })
+        stats["calls"] += 1
+        stats["total_s"] += elapsed
+        stats["max_s"] = max(stats["max_s"], elapsed)
+        stats["peak_kb"] = max(stats["peak_kb"], (frame.peak - frame.start_memory) / 1024)
+        stats["retained_kb"] += (current - frame.start_memory) / 1024
+
+        if profile is not None:
+            profile.create_stats()
+            if not profile.stats:
+                return
+            self.cpu_samples[frame.name] = self.cpu_samples.get(frame.name, 0) + 1
+            if frame.name in self.cpu:
+                self.cpu[frame.name].add(profile)
+            else:
+                self.cpu[frame.name] = pstats.Stats(profile, stream=io.StringIO())
+
+    def _record_allocations(self, name: str):
+        """Líneas de código que más memoria retienen al terminar la etapa"""
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")
+        ])
+        self.allocations[name] = [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_kb": stat.size / 1024,
+                "count": stat.count
+            }
+            for stat in snapshot.statistics("lineno")[:self.top_allocations]
+        ]
+
+    def record_session(self, session_id: str, **sizes_bytes: int):
+        """Memoria atribuida a una sesión de la app (historial, chatbot, ...)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            session = self.sessions.setdefault(session_id, {})
+            session.update({f"{key}_kb": size / 1024 for key, size in sizes_bytes.items()})
+            session["updated_at"] = time.time()
+
+    def _cpu_report(self, name: str) -> List[dict]:
+        stats = self.cpu[name]
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top_functions]
+        return [
+            {
+                "function": f"{os.path.basename(filename)}:{lineno}({function})",
+                "calls": total_calls,
+                "own_s": own_time,
+                "cumulative_s": cumulative_time
+            }
+            for (filename, lineno, function), (_, total_calls, own_time, cumulative_time, _) in rows
+        ]
+
+    def report(self, label: str = "") -> dict:
+        """Informe serializable en JSON (ver compare_reports)"""
+        with self._lock:
+            stages = {
+                name: dict(stats, mean_s=stats["total_s"] / stats["calls"])
+                for name, stats in sorted(self.stages.items())
+            }
+            session_totals = [sum(value for key, value in session.items() if key.endswith("_kb"))
+                              for session in self.sessions.values()]
+            current, _ = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+
+            return {
+                "format": PROFILE_FORMAT,
+                "label": label,
+                "started_at": self.started_at.isoformat(),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "traced_memory_kb": current / 1024,
+                "stages": stages,
+                "cpu": {
+                    name: {"samples": self.cpu_samples[name], "functions": self._cpu_report(name)}
+                    for name in sorted(self.cpu)
+                },
+                "allocations": dict(self.allocations),
+                "sessions": {
+                    "count": len(self.sessions),
+                    "mean_kb": sum(session_totals) / len(session_totals) if session_totals else 0.0,
+                    "max_kb": max(session_totals, default=0.0),
+                    "total_kb": sum(session_totals),
+                    "by_session": dict(self.sessions)
+                }
+            }
+
+    def export(self, folder: str, label: str) -> str:
+        """Guarda el informe JSON y los perfiles de CPU (.prof, para pstats o snakeviz)"""
+        report = self.report(label)
+        os.makedirs(folder, exist_ok=True)
+        base = os.path.join(folder, f"{label}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}")
+
+        with self._lock:
+            for name, stats in self.cpu.items():
+                stats.dump_stats(f"{base}-{name}.prof")
+
+        path = f"{base}.json"
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+_profiler = Profiler(Config.PROFILE_SAMPLE_RATE, Config.PROFILE_TOP_ALLOCATIONS, Config.PROFILE_TOP_FUNCTIONS)
+if Config.PROFILING:
+    _profiler.enable()
+
+def get_profiler() -> Profiler:
+    """Perfilador del proceso (activo con PROFILING=1 o tras enable())"""
+    return _profiler
+
+def profiled(name: str, sample: Optional[float] = None, snapshot: bool = False):
+    """Decorador: mide cada llamada como etapa `name` cuando el perfilado está activo"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _profiler.enabled:
+                return function(*args, **kwargs)
+            with _profiler.stage(name, sample=sample, snapshot=snapshot):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def compare_reports(baseline: dict, current: dict) -> List[dict]:
+    """Diferencias de tiempo medio y pico de memoria por etapa entre dos informes"""
+    rows = []
+    for name in sorted(set(baseline["stages"]) | set(current["stages"])):
+        before = baseline["stages"].get(name)
+        after = current["stages"].get(name)
+        row = {"stage": name}
+        for key in ("mean_s", "peak_kb", "retained_kb"):
+            old = before[key] if before else None
+            new = after[key] if after else None
+            row[key] = (old, new)
+            row[f"{key}_change"] = (new - old) / old if old and new is not None else None
+        rows.append(row)
+    return rows
+
+def print_comparison(baseline: dict, current: dict):
+    print(f"📊 {baseline['label'] or 'base'} ({baseline['created_at'][:19]}) → "
+          f"{current['label'] or 'actual'} ({current['created_at'][:19]})")
+    print(f"{'Etapa':<28} {'Tiempo medio (s)':>24} {'Pico de memoria (KB)':>28}")
+
+    def cell(values, change, digits):
+        old, new = ("—" if value is None else f"{value:.{digits}f}" for value in values)
+        return f"{old} → {new}" + (f" ({change:+.0%})" if change is not None else "")
+
+    for row in compare_reports(baseline, current):
+        print(f"{row['stage']:<28} {cell(row['mean_s'], row['mean_s_change'], 3):>24} "
+              f"{cell(row['peak_kb'], row['peak_kb_change'], 0):>28}")
+
+    sessions = (baseline["sessions"]["mean_kb"], current["sessions"]["mean_kb"])
+    if any(sessions):
+        print(f"👥 Memoria media por sesión: {sessions[0]:.1f} KB → {sessions[1]:.1f} KB")
+
+def load_report(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    if report.get("format") != PROFILE_FORMAT:
+        raise ValueError(f"{path} no es un informe de perfilado compatible")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dos informes de perfilado")
+    parser.add_argument("baseline", help="Informe de referencia (JSON)")
+    parser.add_argument("current", help="Informe a comparar (JSON)")
+    args = parser.parse_args()
+
+    print_comparison(load_report(args.baseline), load_report(args.current))
+
+if __name__ == "__main__":
+    main()
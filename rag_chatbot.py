@@ -1,31 +1,48 @@
 # rag_chatbot.py (Versión Simplificada)
-from typing import List, Dict
+from typing import List, Dict, Iterator, Tuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
 from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
+from langchain_openai.chat_models.base import _convert_chunk_to_generation_chunk
+from langchain_core.messages import AIMessageChunk
+from langchain.prompts import ChatPromptTemplate
 from vector_store import VectorStoreManager
+from http_clients import get_openai_http_client
+from concurrency import SingleFlight, AdmissionController, AdmissionRejected, Deadline, DeadlineExceeded
+from metrics import LLMUsageTracker, RequestTracker
+from cassette import get_cassette, CassetteChatModel
+from profiling import profiled
 from config import Config
+import re
+import time
 
-class RAGChatbot:
-    def __init__(self):
-        self.config = Config()
-        self.vector_manager = VectorStoreManager()
-        self.llm = ChatOpenAI(
-            model=self.config.CHAT_MODEL,
-            temperature=0.1,
-            api_key=self.config.OPENAI_API_KEY
-        )
-        
-        # Template mejorado para el prompt
-        self.prompt_template = PromptTemplate(
-            input_variables=["context", "question"],
-            template="""
-Eres un asistente experto que responde preguntas basándose únicamente en los documentos proporcionados.
+def normalize_question(question: str) -> str:
+    """Normaliza una pregunta para detectar repeticiones (espacios y mayúsculas)"""
+    return re.sub(r"\s+", " ", question).strip().casefold()
 
-CONTEXTO DE LOS DOCUMENTOS:
-{context}
+# Compartido por todas las instancias del proceso (en Streamlit hay una por sesión):
+# preguntas idénticas simultáneas comparten una sola recuperación y llamada al LLM
+_question_flights = SingleFlight()
 
-PREGUNTA DEL USUARIO: {question}
+# Límite de llamadas simultáneas a OpenAI para todo el proceso
+_llm_admission = AdmissionController(
+    max_concurrent=Config.LLM_MAX_CONCURRENT,
+    max_queue=Config.LLM_MAX_QUEUE,
+    queue_timeout=Config.LLM_QUEUE_TIMEOUT
+)
+
+# Hilos propios para las peticiones al LLM, separados de los de recuperación: una búsqueda
+# colgada no las retrasa. Cada petición ocupa una plaza de _llm_admission, que limita cuántas hay
+_llm_executor = ThreadPoolExecutor(max_workers=Config.LLM_MAX_CONCURRENT, thread_name_prefix="llm")
+
+# Tokens cacheados por OpenAI y tiempos de respuesta de todas las llamadas del proceso
+_llm_usage = LLMUsageTracker()
+
+# Latencia de extremo a extremo, peticiones duplicadas (hedging) y plazos agotados
+_requests = RequestTracker()
+
+# Parte fija del prompt. Va primero y nunca cambia para que OpenAI pueda reutilizar
+# el prefijo en caché (el contexto variable va en el mensaje siguiente)
+SYSTEM_PROMPT = """Eres un asistente experto que responde preguntas basándose únicamente en los documentos proporcionados.
 
 INSTRUCCIONES IMPORTANTES:
 1. Responde ÚNICAMENTE basándote en la información del contexto proporcionado
@@ -34,28 +51,133 @@ INSTRUCCIONES IMPORTANTES:
 4. Responde siempre en español
 5. Si hay múltiples respuestas posibles, menciona todas las relevantes
 
-RESPUESTA:"""
-        )
+El siguiente mensaje contiene el contexto de los documentos y la pregunta del usuario."""
+
+NO_INFORMATION_ANSWER = "No encuentro esa información en los documentos proporcionados."
+
+BUSY_ANSWER = ("⚠️ El sistema está atendiendo muchas consultas en este momento. "
+               "Mientras tanto, estos son los fragmentos más relevantes de los documentos. "
+               "Inténtalo de nuevo en unos segundos para obtener una respuesta completa.")
+
+TIMEOUT_ANSWER = ("⚠️ La respuesta está tardando más de lo habitual. "
+                  "Estos son los fragmentos más relevantes de los documentos; "
+                  "inténtalo de nuevo en unos segundos para obtener una respuesta completa.")
+
+RETRIEVAL_TIMEOUT_ANSWER = ("⚠️ La búsqueda en los documentos está tardando más de lo habitual. "
+                            "Inténtalo de nuevo en unos segundos.")
+
+PARTIAL_NOTICE = "\n\n⚠️ Respuesta incompleta: se agotó el tiempo de espera."
+
+def select_relevant(scored_documents, min_score: float, relative_score: float, max_k: int) -> List:
+    """Conserva los fragmentos con similitud suficiente, absoluta y respecto al mejor"""
+    if not scored_documents:
+        return []
+    
+    best = max(score for _, score in scored_documents)
+    threshold = max(min_score, best * relative_score)
+    ranked = sorted(scored_documents, key=lambda item: item[1], reverse=True)
+    
+    return [doc for doc, score in ranked if score >= threshold][:max_k]
+
+def llm_usage(message) -> Dict[str, int]:
+    """Extrae tokens de entrada, cacheados y de salida de la respuesta del LLM"""
+    token_usage = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+    usage_metadata = getattr(message, "usage_metadata", None) or {}
+    
+    cached = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    if cached is None:
+        cached = (usage_metadata.get("input_token_details") or {}).get("cache_read", 0)
+    
+    return {
+        "prompt_tokens": token_usage.get("prompt_tokens", usage_metadata.get("input_tokens", 0)),
+        "cached_tokens": cached or 0,
+        "completion_tokens": token_usage.get("completion_tokens", usage_metadata.get("output_tokens", 0))
+    }
+
+class UsageChatOpenAI(ChatOpenAI):
+    """ChatOpenAI que conserva los tokens cacheados en el uso de las respuestas en streaming
+
+    langchain-openai 0.1.x descarta prompt_tokens_details al convertir los fragmentos, así que se
+    leen del último fragmento de OpenAI y se añaden como usage_metadata.input_token_details.cache_read
+    """
+
+    def _stream(self, messages, stop=None, run_manager=None, *, stream_usage=None, **kwargs):
+        if self.include_response_headers or "response_format" in kwargs:
+            # Casos que este módulo no usa: el comportamiento original
+            yield from super()._stream(messages, stop=stop, run_manager=run_manager,
+                                       stream_usage=stream_usage, **kwargs)
+            return
+
+        # Como ChatOpenAI._stream: el uso solo llega si se pide en stream_options
+        if self._should_stream_usage(stream_usage, **kwargs):
+            kwargs["stream_options"] = {"include_usage": True}
+        kwargs["stream"] = True
+        payload = self._get_request_payload(messages, stop=stop, **kwargs)
+
+        default_chunk_class = AIMessageChunk
+        with self.client.create(**payload) as response:
+            for chunk in response:
+                if not isinstance(chunk, dict):
+                    chunk = chunk.model_dump()
+                generation_chunk = _convert_chunk_to_generation_chunk(chunk, default_chunk_class, None)
+                if generation_chunk is None:
+                    continue
+
+                details = (chunk.get("usage") or {}).get("prompt_tokens_details") or {}
+                usage_metadata = generation_chunk.message.usage_metadata
+                if usage_metadata and details.get("cached_tokens") is not None:
+                    usage_metadata["input_token_details"] = {"cache_read": details["cached_tokens"]}
+
+                default_chunk_class = generation_chunk.message.__class__
+                if run_manager:
+                    run_manager.on_llm_new_token(generation_chunk.text, chunk=generation_chunk)
+                yield generation_chunk
+
+class RAGChatbot:
+    def __init__(self, vector_manager=None, llm=None):
+        self.config = Config()
+        self.vector_manager = vector_manager or VectorStoreManager()
+        self.llm = llm or self._create_llm()
         
-        self.qa_chain = None
+        # Mensaje de sistema fijo seguido del contexto y la pregunta
+        self.prompt_template = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
+            ("human", """CONTEXTO DE LOS DOCUMENTOS:
+{context}
+
+PREGUNTA DEL USUARIO: {question}
+
+RESPUESTA:""")
+        ])
+        
+        self.ready = False  # hasta que setup_retrieval_chain() abre la base vectorial
+    
+    def _create_llm(self):
+        """Crea el modelo de chat (envuelto en el cassette si hay grabación/reproducción)"""
+        cassette = get_cassette()
+        
+        llm = None
+        if cassette is None or cassette.mode != "replay":
+            llm = UsageChatOpenAI(
+                model=self.config.CHAT_MODEL,
+                temperature=0.1,
+                api_key=self.config.OPENAI_API_KEY,
+                http_client=get_openai_http_client(),
+                stream_usage=True
+            )
+        
+        if cassette:
+            return CassetteChatModel(inner=llm, cassette=cassette, model_name=self.config.CHAT_MODEL)
+        return llm
     
     def setup_retrieval_chain(self):
-        """Configura la cadena de recuperación y generación"""
+        """Comprueba que la base vectorial está disponible y deja el chatbot listo para responder"""
         print("🔄 Configurando cadena RAG...")
         
         try:
-            vector_store = self.vector_manager.get_vector_store()
-            
-            self.qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=vector_store.as_retriever(
-                    search_type="similarity",
-                    search_kwargs={"k": 4}  # Número de chunks relevantes
-                ),
-                chain_type_kwargs={"prompt": self.prompt_template},
-                return_source_documents=True
-            )
+            # La recuperación y la generación se hacen en _answer / stream_chat
+            self.vector_manager.get_vector_store()
+            self.ready = True
             
             print("✅ Cadena RAG configurada correctamente")
             return True
@@ -64,9 +186,9 @@ RESPUESTA:"""
             print(f"❌ Error configurando RAG: {e}")
             return False
     
-    def chat(self, question: str) -> Dict:
+    def chat(self, question: str, user_id: str = "anonimo") -> Dict:
         """Procesa una pregunta y retorna respuesta con fuentes"""
-        if not self.qa_chain:
+        if not self.ready:
             return {
                 "answer": "❌ El sistema no está configurado. Ejecuta setup_retrieval_chain() primero.",
                 "sources": [],
@@ -80,19 +202,50 @@ RESPUESTA:"""
                 "success": True
             }
         
+        # El resultado se copia para que cada llamador pueda modificarlo sin afectar a los demás
+        start = time.perf_counter()
+        result = _question_flights.do(normalize_question(question), self._answer, question, user_id)
+        _requests.record(time.perf_counter() - start)
+        return dict(result, sources=list(result["sources"]))
+    
+    @profiled("chat.consulta", sample=0)
+    def _answer(self, question: str, user_id: str) -> Dict:
+        """Ejecuta la cadena RAG para una pregunta"""
         try:
             print(f"🔍 Procesando pregunta: {question[:50]}...")
+            deadline = Deadline(self.config.REQUEST_DEADLINE)
             
-            # Ejecutar la cadena RAG
-            result = self.qa_chain.invoke({"query": question})
+            # Recuperación y generación, cada una dentro del plazo de la consulta
+            try:
+                source_documents = self._retrieve(question, deadline)
+            except DeadlineExceeded as e:
+                print(f"⏱️ {e}")
+                _requests.count("deadline_exceeded")
+                return {"answer": RETRIEVAL_TIMEOUT_ANSWER, "sources": [], "success": True, "degraded": True}
+            
+            if not source_documents:
+                print("ℹ️ Ningún fragmento supera el umbral de similitud, se omite el LLM")
+                return {"answer": NO_INFORMATION_ANSWER, "sources": [], "success": True}
+            
+            try:
+                answer, complete = self._generate(question, source_documents, deadline, user_id)
+            except AdmissionRejected as e:
+                print(f"⚠️ LLM saturado ({e}), respuesta solo con fuentes")
+                return self._degraded_answer(source_documents)
+            
+            if not complete:
+                print("⏱️ Plazo agotado durante la generación")
+                if not answer:
+                    return self._degraded_answer(source_documents, TIMEOUT_ANSWER)
+                return dict(self._degraded_answer(source_documents, answer + PARTIAL_NOTICE), partial=True)
             
             # Extraer fuentes únicas
-            sources = self._extract_sources(result.get("source_documents", []))
+            sources = self._extract_sources(source_documents)
             
             print(f"✅ Respuesta generada con {len(sources)} fuentes")
             
             return {
-                "answer": result["result"],
+                "answer": answer,
                 "sources": sources,
                 "success": True
             }
@@ -105,6 +258,208 @@ RESPUESTA:"""
                 "success": False
             }
     
+    def _retrieve(self, question: str, deadline: Deadline) -> List:
+        """Recupera una vez un conjunto amplio de candidatos y se queda con los relevantes"""
+        query_vector = deadline.run("embedding", self.vector_manager.embed_query, question,
+                                    budget=self.config.EMBEDDING_TIMEOUT)
+        scored_documents = deadline.run("búsqueda", self.vector_manager.search_by_vector, query_vector,
+                                        self.config.RETRIEVAL_FETCH_K, budget=self.config.SEARCH_TIMEOUT)
+        return select_relevant(
+            scored_documents,
+            min_score=self.config.RETRIEVAL_MIN_SCORE,
+            relative_score=self.config.RETRIEVAL_RELATIVE_SCORE,
+            max_k=self.config.RETRIEVAL_MAX_K
+        )
+    
+    def _build_messages(self, question: str, source_documents) -> List:
+        """Construye los mensajes del prompt a partir de los fragmentos recuperados"""
+        context = "\n\n".join(doc.page_content for doc in source_documents)
+        return self.prompt_template.format_messages(context=context, question=question)
+    
+    def _hedge_delay(self) -> float:
+        """Espera antes de duplicar la petición: percentil reciente del tiempo hasta el primer token"""
+        delay = _llm_usage.first_token_percentile(self.config.LLM_HEDGE_PERCENTILE, self.config.LLM_HEDGE_MIN_SAMPLES)
+        if delay is None:
+            delay = self.config.LLM_HEDGE_DEFAULT_DELAY
+        return max(self.config.LLM_HEDGE_MIN_DELAY, delay)
+    
+    @profiled("chat.generacion")
+    def _stream_attempt(self, messages, attempt: Dict, timeout: float) -> Dict:
+        """Una petición al LLM con su plaza de admisión; el texto se acumula para una respuesta parcial"""
+        start = time.perf_counter()
+        
+        try:
+            # Timeout de la llamada HTTP: una petición abandonada no sobrevive al plazo de la consulta
+            for chunk in self.llm.stream(messages, timeout=timeout):
+                # Cerrar el stream corta la generación de la petición perdedora
+                if attempt["cancelled"]:
+                    break
+                if chunk.content:
+                    if attempt["first_token"] is None:
+                        attempt["first_token"] = time.perf_counter() - start
+                    attempt["parts"].append(chunk.content)
+                if chunk.usage_metadata:
+                    attempt["usage"] = llm_usage(chunk)
+            
+            attempt["latency"] = time.perf_counter() - start
+            return attempt
+        finally:
+            # La plaza se libera cuando la petición termina de verdad, no cuando se abandona
+            _llm_admission.release()
+    
+    def _generate(self, question: str, source_documents, deadline: Deadline, user_id: str) -> Tuple[str, bool]:
+        """Llama al LLM dentro del plazo; retorna el texto y si está completo (AdmissionRejected sin plaza)"""
+        messages = self._build_messages(question, source_documents)
+        attempts = []
+        futures = {}
+        
+        def launch():
+            # Se llama con una plaza ya ocupada; pasa a ser del intento, que la libera al terminar
+            attempt = {"parts": [], "usage": {}, "first_token": None, "latency": None, "cancelled": False}
+            try:
+                future = _llm_executor.submit(self._stream_attempt, messages, attempt, deadline.remaining())
+            except Exception:
+                _llm_admission.release()
+                raise
+            attempts.append(attempt)
+            futures[future] = attempt
+        
+        _llm_admission.acquire(user_id, timeout=deadline.remaining())
+        launch()
+        hedge_at = time.monotonic() + self._hedge_delay() if self.config.LLM_HEDGE else None
+        error = None
+        
+        try:
+            while futures:
+                timeout = deadline.remaining()
+                if hedge_at is not None:
+                    timeout = min(timeout, max(0.0, hedge_at - time.monotonic()))
+                
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    attempt = futures.pop(future)
+                    if future.exception() is not None:
+                        error = future.exception()
+                        continue
+                    
+                    if attempt is not attempts[0]:
+                        _requests.count("hedge_wins")
+                    _llm_usage.record(attempt["usage"], attempt["latency"], attempt["first_token"])
+                    usage = attempt["usage"]
+                    print(f"🧾 Tokens de entrada: {usage.get('prompt_tokens', 0)} ({usage.get('cached_tokens', 0)} desde caché)")
+                    return "".join(attempt["parts"]), True
+                
+                if deadline.expired():
+                    break
+                
+                # Petición duplicada solo si la primera aún no ha empezado a responder y hay una
+                # plaza libre sin esperar: el hedging nunca supera LLM_MAX_CONCURRENT ni adelanta a la cola
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    if attempts[0]["first_token"] is None and _llm_admission.try_acquire():
+                        print("⏱️ Primer token lento, se lanza una petición duplicada")
+                        _requests.count("hedged")
+                        launch()
+            
+            if error is not None and not futures:
+                raise error
+            
+            # Plazo agotado: el texto más largo recibido hasta ahora
+            _requests.count("deadline_exceeded")
+            return max(("".join(attempt["parts"]) for attempt in attempts), key=len), False
+        finally:
+            for attempt in attempts:
+                attempt["cancelled"] = True
+    
+    def _degraded_answer(self, source_documents, answer: str = BUSY_ANSWER) -> Dict:
+        """Respuesta sin (o con parte de) la generación del LLM, con los fragmentos más relevantes"""
+        return {
+            "answer": answer,
+            "sources": self._extract_sources(source_documents),
+            "success": True,
+            "degraded": True
+        }
+    
+    def stream_chat(self, question: str, user_id: str = "anonimo") -> Iterator[Dict]:
+        """Procesa una pregunta emitiendo la respuesta por fragmentos y al final las fuentes"""
+        if not self.ready:
+            yield {"type": "error", "content": "❌ El sistema no está configurado. Ejecuta setup_retrieval_chain() primero."}
+            return
+        
+        if not question.strip():
+            yield {"type": "token", "content": "Por favor, haz una pregunta específica sobre tus documentos."}
+            yield {"type": "sources", "sources": []}
+            return
+        
+        try:
+            print(f"🔍 Procesando pregunta (streaming): {question[:50]}...")
+            deadline = Deadline(self.config.REQUEST_DEADLINE)
+            
+            try:
+                source_documents = self._retrieve(question, deadline)
+            except DeadlineExceeded as e:
+                print(f"⏱️ {e}")
+                _requests.count("deadline_exceeded")
+                yield {"type": "token", "content": RETRIEVAL_TIMEOUT_ANSWER}
+                yield {"type": "sources", "sources": []}
+                return
+            
+            if not source_documents:
+                yield {"type": "token", "content": NO_INFORMATION_ANSWER}
+                yield {"type": "sources", "sources": []}
+                return
+            
+            messages = self._build_messages(question, source_documents)
+            
+            # Sin hedging: los fragmentos ya enviados comprometen la respuesta con una petición
+            try:
+                _llm_admission.acquire(user_id, timeout=deadline.remaining())
+            except AdmissionRejected:
+                yield {"type": "token", "content": self._degraded_answer(source_documents)["answer"]}
+                yield {"type": "sources", "sources": self._extract_sources(source_documents)}
+                return
+            
+            pending = None
+            try:
+                start = time.perf_counter()
+                first_token = None
+                usage = {}
+                
+                # Cada fragmento (también el primero) se espera como mucho hasta el plazo
+                chunks = self.llm.stream(messages, timeout=deadline.remaining())
+                while True:
+                    pending = _llm_executor.submit(next, chunks, None)
+                    try:
+                        chunk = pending.result(timeout=deadline.remaining())
+                    except FutureTimeout:
+                        _requests.count("deadline_exceeded")
+                        yield {"type": "token", "content": PARTIAL_NOTICE if first_token is not None else TIMEOUT_ANSWER}
+                        break
+                    pending = None
+                    
+                    if chunk is None:
+                        break
+                    if chunk.content:
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        yield {"type": "token", "content": chunk.content}
+                    if chunk.usage_metadata:
+                        usage = llm_usage(chunk)
+                
+                _llm_usage.record(usage, time.perf_counter() - start, first_token)
+            finally:
+                if pending is None:
+                    _llm_admission.release()
+                else:
+                    # Llamada abandonada: la plaza se libera cuando termine (con su timeout HTTP)
+                    pending.add_done_callback(lambda _: _llm_admission.release())
+            
+            yield {"type": "sources", "sources": self._extract_sources(source_documents)}
+        
+        except Exception as e:
+            print(f"❌ Error procesando consulta: {e}")
+            yield {"type": "error", "content": f"❌ Error procesando la consulta: {str(e)}"}
+    
     def _extract_sources(self, source_documents) -> List[Dict]:
         """Extrae información de las fuentes de manera única"""
         sources = []
@@ -136,7 +491,11 @@ RESPUESTA:"""
                 "vector_dimension": vector_stats.get("dimension", 0),
                 "model_used": self.config.CHAT_MODEL,
                 "embedding_model": self.config.EMBEDDING_MODEL,
-                "status": "✅ Sistema operativo" if self.qa_chain else "⚠️ Sistema no configurado"
+                "coalesced_requests": _question_flights.stats()["coalesced"],
+                "llm_queue": _llm_admission.stats(),
+                "llm_usage": _llm_usage.stats(),
+                "requests": _requests.stats(),
+                "status": "✅ Sistema operativo" if self.ready else "⚠️ Sistema no configurado"
             }
             
         except Exception as e:
@@ -151,7 +510,7 @@ RESPUESTA:"""
         
         try:
             # Configurar si no está configurado
-            if not self.qa_chain:
+            if not self.ready:
                 if not self.setup_retrieval_chain():
                     return False
             
@@ -159,6 +518,11 @@ RESPUESTA:"""
             test_question = "¿Qué temas o información principal contienen estos documentos?"
             result = self.chat(test_question)
             
+            if result.get("degraded"):
+                # Fuentes sin respuesta del LLM (saturado o fuera de plazo): no cuenta como éxito
+                print("⚠️ Prueba completada sin respuesta del LLM")
+                return False
+            
             if result["success"] and result["sources"]:
                 print("✅ Prueba del sistema exitosa")
                 print(f"📄 Fuentes encontradas: {len(result['sources'])}")
@@ -169,4 +533,8 @@ RESPUESTA:"""
                 
         except Exception as e:
             print(f"❌ Error en prueba del sistema: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def get_coalescing_stats(self) -> Dict:
+        """Métricas de agrupación de preguntas idénticas en curso"""
+        return _question_flights.stats()
@@ -0,0 +1,137 @@
+# section_index.py - Vectores de documentos y secciones para la recuperación en dos etapas
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+def assign_sections(documents: List[Document], chunks_per_section: int = 8):
+    """Agrupa chunks consecutivos de cada documento en secciones (metadata section_id)"""
+    positions: Dict[str, int] = {}
+
+    for doc in documents:
+        source = doc.metadata["source"]
+        position = positions.get(source, 0)
+        positions[source] = position + 1
+        doc.metadata["section_id"] = f"{source}#s{position // chunks_per_section}"
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class SectionIndex:
+    """Secciones (grupos de chunks) con su embedding y documentos con la media de sus secciones"""
+
+    VECTORS_FILE = "sections.npy"
+    SECTIONS_FILE = "sections.json"
+
+    def __init__(self, sections: List[dict], vectors: np.ndarray):
+        self.sections = sections
+        self.vectors = _normalize(vectors)
+
+        self.documents = sorted({section["source"] for section in sections})
+        document_ids = {name: i for i, name in enumerate(self.documents)}
+        self.section_documents = np.array([document_ids[s["source"]] for s in sections], dtype=np.int64)
+
+        sums = np.zeros((len(self.documents), self.vectors.shape[1]), dtype=np.float32)
+        np.add.at(sums, self.section_documents, self.vectors)
+        self.document_vectors = _normalize(sums)
+
+    def __len__(self) -> int:
+        return len(self.sections)
+
+    @classmethod
+    def build(cls, documents: List[Document], embeddings: Embeddings, cache_folder: str,
+              cache_key: str = "") -> Optional["SectionIndex"]:
+        """Calcula los embeddings de las secciones; los de documentos sin cambios salen de la caché"""
+        by_section: Dict[str, List[Document]] = {}
+        for doc in documents:
+            if "section_id" in doc.metadata:
+                by_section.setdefault(doc.metadata["section_id"], []).append(doc)
+        if not by_section:
+            return None
+
+        sections = []
+        texts = []
+        for section_id, chunks in by_section.items():
+            sections.append({
+                "section_id": section_id,
+                "source": chunks[0].metadata["source"],
+                "page_start": chunks[0].metadata.get("page_start"),
+                "page_end": chunks[-1].metadata.get("page_end"),
+                "chunks": len(chunks)
+            })
+            texts.append("\n".join(chunk.page_content for chunk in chunks))
+
+        # Caché por documento: la clave cambia si cambia cualquiera de sus secciones
+        by_source: Dict[str, List[int]] = {}
+        for i, section in enumerate(sections):
+            by_source.setdefault(section["source"], []).append(i)
+
+        os.makedirs(cache_folder, exist_ok=True)
+        rows = {}
+
+        for source, indexes in by_source.items():
+            digest = hashlib.sha256(cache_key.encode("utf-8"))
+            for i in indexes:
+                digest.update(texts[i].encode("utf-8"))
+            cache_path = os.path.join(cache_folder, f"{digest.hexdigest()}.npy")
+
+            if os.path.exists(cache_path):
+                source_vectors = np.load(cache_path)
+            else:
+                source_vectors = np.asarray(embeddings.embed_documents([texts[i] for i in indexes]), dtype=np.float32)
+                np.save(cache_path, source_vectors)
+
+            for i, vector in zip(indexes, source_vectors):
+                rows[i] = vector
+
+        vectors = np.vstack([rows[i] for i in range(len(sections))])
+        return cls(sections, vectors)
+
+    def select(self, query_vector, top_documents: int, top_sections: int) -> List[str]:
+        """Etapa 1: documentos más similares y, dentro de ellos, las secciones más similares"""
+        query = _normalize(np.asarray(query_vector)[None, :])[0]
+
+        document_scores = self.document_vectors @ query
+        top_documents = min(top_documents, len(self.documents))
+        selected_documents = np.argpartition(-document_scores, top_documents - 1)[:top_documents]
+
+        candidates = np.flatnonzero(np.isin(self.section_documents, selected_documents))
+        section_scores = self.vectors[candidates] @ query
+        top_sections = min(top_sections, len(candidates))
+        best = candidates[np.argpartition(-section_scores, top_sections - 1)[:top_sections]]
+
+        return [self.sections[i]["section_id"] for i in best]
+
+    def save(self, folder: str):
+        os.makedirs(folder, exist_ok=True)
+        np.save(os.path.join(folder, self.VECTORS_FILE), self.vectors)
+        with open(os.path.join(folder, self.SECTIONS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.sections, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, folder: str, dimension: Optional[int] = None) -> Optional["SectionIndex"]:
+        """Carga el índice de secciones; None si no existe o no se puede usar con `dimension`"""
+        sections_path = os.path.join(folder, cls.SECTIONS_FILE)
+        if not os.path.exists(sections_path):
+            return None
+
+        with open(sections_path, "r", encoding="utf-8") as f:
+            sections = json.load(f)
+        vectors = np.load(os.path.join(folder, cls.VECTORS_FILE))
+
+        # La dimensión con la que se calcularon es la de los vectores guardados
+        stored_dimension = vectors.shape[1]
+        if dimension is not None and stored_dimension != dimension:
+            if stored_dimension < dimension:
+                print(f"⚠️  Índice de secciones con dimensión {stored_dimension} (se esperaba {dimension}); "
+                      f"se usará la búsqueda directa hasta la próxima ingesta")
+                return None
+            # Tras migrate_dimensions.py: se recortan igual que los vectores de Pinecone (__init__ renormaliza)
+            vectors = vectors[:, :dimension]
+        return cls(sections, vectors)
@@ -0,0 +1,57 @@
+# snapshot.py - Resumen estático de la ingesta para el arranque de la app
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from config import Config
+
+SNAPSHOT_FORMAT = 1
+
+def build_snapshot(document_stats: Dict[str, dict], index_stats: dict, config: Config) -> dict:
+    """Construye el snapshot a partir de las estadísticas de la ingesta"""
+    documents = []
+    for filename, stats in sorted(document_stats.items()):
+        documents.append({
+            "filename": filename,
+            "file_path": stats["file_path"],
+            "size_bytes": os.path.getsize(stats["file_path"]),
+            "pages": stats["pages"],
+            "chunks": stats["chunks"]
+        })
+    
+    # La versión cambia con los documentos o con los parámetros de ingesta
+    fingerprint = json.dumps({
+        "documents": [(doc["filename"], doc["size_bytes"], doc["chunks"]) for doc in documents],
+        "index": config.INDEX_NAME,
+        "splitter": [config.TEXT_SPLITTER, config.CHUNK_TOKENS, config.CHUNK_OVERLAP_TOKENS]
+    }, sort_keys=True)
+    created_at = datetime.now(timezone.utc)
+    
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "ingest_version": f"{created_at:%Y%m%d-%H%M%S}-{hashlib.sha256(fingerprint.encode()).hexdigest()[:8]}",
+        "created_at": created_at.isoformat(),
+        "index_name": config.INDEX_NAME,
+        "embedding_model": config.EMBEDDING_MODEL,
+        "embedding_dimensions": config.EMBEDDING_DIMENSIONS,
+        "documents": documents,
+        "index_stats": index_stats
+    }
+
+def write_snapshot(snapshot: dict, path: str):
+    """Escribe el snapshot de forma atómica"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def load_snapshot(path: str) -> Optional[dict]:
+    """Lee el snapshot; None si no existe, es ilegible o de otro formato"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    return snapshot if snapshot.get("format") == SNAPSHOT_FORMAT else None
@@ -0,0 +1,62 @@
+# text_cache.py
+import gzip
+import hashlib
+import json
+import os
+from typing import List, Optional
+import PyPDF2
+
+# Cambiar el sufijo invalida la caché si cambia la forma de extraer el texto
+EXTRACTOR_VERSION = f"pypdf2-{PyPDF2.__version__}-v1"
+
+class PageTextCache:
+    """Caché en disco del texto extraído de cada página de un PDF"""
+    
+    def __init__(self, folder: str, extractor_version: str = EXTRACTOR_VERSION):
+        self.folder = folder
+        self.extractor_version = extractor_version
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        """Calcula el SHA-256 del contenido del archivo"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def _cache_path(self, file_hash: str) -> str:
+        return os.path.join(self.folder, f"{file_hash}-{self.extractor_version}.json.gz")
+    
+    def get_pages(self, file_hash: str) -> Optional[List[str]]:
+        """Retorna el texto por página (índice = número de página - 1) o None si no está en caché"""
+        cache_path = self._cache_path(file_hash)
+        
+        try:
+            with gzip.open(cache_path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        return entry["pages"]
+    
+    def put_pages(self, file_hash: str, pages: List[str]):
+        """Guarda el texto por página de un PDF"""
+        os.makedirs(self.folder, exist_ok=True)
+        cache_path = self._cache_path(file_hash)
+        tmp_path = f"{cache_path}.tmp"
+        
+        entry = {
+            "file_hash": file_hash,
+            "extractor": self.extractor_version,
+            "pages": pages
+        }
+        
+        # Escritura atómica para no dejar entradas corruptas si el proceso se interrumpe
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
@@ -0,0 +1,130 @@
+# token_splitter.py
+import re
+from typing import Dict, List
+
+# Fin de oración (puntuación seguida de espacio) o párrafo (línea en blanco)
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…:;])\s+|\n\s*\n")
+
+def join_pages(pages: List[str]) -> str:
+    """Une el texto de las páginas con marcadores de página"""
+    parts = []
+    for page_num, page_text in enumerate(pages):
+        if page_text:
+            parts.append(f"\n--- Página {page_num + 1} ---\n{page_text}\n")
+    return "".join(parts)
+
+class SentenceTokenSplitter:
+    """Divide texto en chunks por tokens (tiktoken) sin cortar oraciones ni mezclar páginas pequeñas"""
+
+    def __init__(self, encoding, chunk_tokens: int = 256, overlap_tokens: int = 48):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens debe ser menor que chunk_tokens")
+
+        self.encoding = encoding
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def _sentences(self, pages: List[str]) -> List[Dict]:
+        """Segmenta el texto unido en oraciones con su página y posición"""
+        spans = []
+        offset = 0
+
+        for page_num, page_text in enumerate(pages):
+            if not page_text:
+                continue
+
+            header = f"\n--- Página {page_num + 1} ---\n"
+            page_start = offset + len(header)
+            # Los tokens se cuentan incluyendo el separador previo (y el marcador de página)
+            # para que la suma por oraciones coincida con el chunk final
+            count_start = offset
+            start = 0
+
+            for match in _SENTENCE_BOUNDARY.finditer(page_text):
+                if match.start() > start:
+                    spans.append((count_start, page_start + start, page_start + match.start(), page_num + 1))
+                    count_start = page_start + match.start()
+                start = match.end()
+            if start < len(page_text):
+                spans.append((count_start, page_start + start, page_start + len(page_text), page_num + 1))
+
+            offset = page_start + len(page_text) + 1
+
+        return [
+            {"count_start": count_start, "start": start, "end": end, "page": page}
+            for count_start, start, end, page in spans
+        ]
+
+    def _split_long_sentence(self, text: str, sentence: Dict) -> List[Dict]:
+        """Parte una oración más larga que chunk_tokens en tramos de tokens"""
+        tokens = self.encoding.encode_ordinary(text[sentence["start"]:sentence["end"]])
+        _, offsets = self.encoding.decode_with_offsets(tokens)
+        pieces = []
+
+        for i in range(0, len(tokens), self.chunk_tokens):
+            start = sentence["start"] + offsets[i]
+            end = sentence["start"] + offsets[i + self.chunk_tokens] if i + self.chunk_tokens < len(tokens) else sentence["end"]
+            pieces.append({"start": start, "end": end, "page": sentence["page"],
+                           "tokens": min(self.chunk_tokens, len(tokens) - i)})
+
+        return pieces
+
+    def split_pages(self, pages: List[str]) -> List[Dict]:
+        """Retorna chunks con texto, offsets de caracteres (sobre join_pages), páginas y tokens"""
+        text = join_pages(pages)
+        sentences = self._sentences(pages)
+
+        # Cada oración se tokeniza una sola vez: coste lineal en el tamaño del texto
+        encode = self.encoding.encode_ordinary
+        counts = [len(encode(text[s["count_start"]:s["end"]])) for s in sentences]
+
+        units = []
+        for sentence, count in zip(sentences, counts):
+            if count > self.chunk_tokens:
+                units.extend(self._split_long_sentence(text, sentence))
+            else:
+                units.append(dict(sentence, tokens=count))
+
+        chunks = []
+        current = []
+        current_tokens = 0
+
+        def emit():
+            chunks.append({
+                "text": text[current[0]["start"]:current[-1]["end"]],
+                "start_index": current[0]["start"],
+                "end_index": current[-1]["end"],
+                "page_start": current[0]["page"],
+                "page_end": current[-1]["page"],
+                "tokens": sum(unit["tokens"] for unit in current)
+            })
+
+        for unit in units:
+            new_page = current and unit["page"] != current[-1]["page"]
+
+            # Al cambiar de página se cierra el chunk si ya tiene un tamaño razonable
+            if new_page and current_tokens >= self.chunk_tokens // 2:
+                emit()
+                current, current_tokens = [], 0
+            elif current and current_tokens + unit["tokens"] > self.chunk_tokens:
+                emit()
+                # Solapamiento: se conservan las últimas oraciones hasta overlap_tokens
+                overlap = []
+                overlap_tokens = 0
+                for previous in reversed(current):
+                    if overlap_tokens + previous["tokens"] > self.overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_tokens += previous["tokens"]
+                current, current_tokens = overlap, overlap_tokens
+
+                if current_tokens + unit["tokens"] > self.chunk_tokens:
+                    current, current_tokens = [], 0
+
+            current.append(unit)
+            current_tokens += unit["tokens"]
+
+        if current:
+            emit()
+
+        return chunks
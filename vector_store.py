@@ -1,27 +1,118 @@
 # vector_store.py (Versión Simplificada)
-from pinecone import Pinecone, ServerlessSpec
-from typing import List
+from pinecone import ServerlessSpec
+from typing import List, Tuple
 from langchain.schema import Document
 from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
 from config import Config
+from ivf_index import LocalIVFVectorStore
+from http_clients import get_openai_http_client, get_pinecone_client
+from cassette import get_cassette, CassetteEmbeddings, CassetteVectorStore
+from index_versions import ActiveIndexPointer, PineconeIndexPointer, CONTROL_NAMESPACE, STORAGE_CHUNK_STORE, STORAGE_HYBRID, STORAGE_LOCAL, STORAGE_METADATA
+from section_index import SectionIndex
+from chunk_store import ChunkStore, PineconeIdVectorStore
+from profiling import profiled
+import math
+import os
+import shutil
 import time
 
 class VectorStoreManager:
-    def __init__(self):
+    def __init__(self, namespace: str = None):
         self.config = Config()
-        self.embeddings = OpenAIEmbeddings(
+        # Sin namespace explícito se sirve la versión activa (y se sigue cualquier cambio posterior)
+        self._fixed_namespace = namespace
+        self.pointer = ActiveIndexPointer(self.config.ACTIVE_INDEX_PATH)  # con Pinecone, ver init_pinecone
+        self.cassette = get_cassette()
+        self.replaying = self.cassette is not None and self.cassette.mode == "replay"
+        
+        self.embeddings = self._create_embeddings()
+        # Las consultas usan su propio cliente: la petición HTTP termina con el presupuesto de la
+        # etapa de embedding (sin reintentos que lo superen) en lugar de ocupar su hilo hasta HTTP_TIMEOUT
+        self.query_embeddings = self._create_embeddings(timeout=self.config.EMBEDDING_TIMEOUT, max_retries=0)
+        self._vector_store = None
+        self._section_index = None
+        self._section_index_loaded = False
+        
+        if self.replaying:
+            # Sin conexión: las búsquedas y estadísticas salen del cassette
+            print(f"📼 Reproduciendo llamadas desde {self.cassette.path}")
+        elif self.config.VECTOR_BACKEND == "local":
+            self.init_local_index()
+        else:
+            self.init_pinecone()
+        self._store_namespace = self.namespace
+    
+    def _create_embeddings(self, **kwargs):
+        """Embeddings de OpenAI (envueltos en el cassette si hay grabación/reproducción)"""
+        embeddings = None if self.replaying else OpenAIEmbeddings(
             model=self.config.EMBEDDING_MODEL,
-            api_key=self.config.OPENAI_API_KEY
+            dimensions=self.config.EMBEDDING_DIMENSIONS,
+            api_key=self.config.OPENAI_API_KEY,
+            http_client=get_openai_http_client(),
+            **kwargs
         )
-        self.init_pinecone()
+        if self.cassette:
+            embeddings = CassetteEmbeddings(
+                embeddings, self.cassette, self.config.EMBEDDING_MODEL, self.config.EMBEDDING_DIMENSIONS
+            )
+        return embeddings
+    
+    @property
+    def namespace(self) -> str:
+        """Namespace (o subcarpeta local) de la versión del índice en uso"""
+        if self._fixed_namespace is not None:
+            return self._fixed_namespace
+        return self.pointer.namespace()
+    
+    def local_folder(self, namespace: str) -> str:
+        return os.path.join(self.config.LOCAL_INDEX_FOLDER, namespace) if namespace else self.config.LOCAL_INDEX_FOLDER
+    
+    def section_folder(self, namespace: str) -> str:
+        return os.path.join(self.config.SECTION_INDEX_FOLDER, namespace or "default")
+    
+    def chunk_store_folder(self, namespace: str) -> str:
+        return os.path.join(self.config.CHUNK_STORE_FOLDER, namespace or "default")
+    
+    def storage_format(self) -> str:
+        """Dónde están los textos de la versión en uso (ver index_versions)"""
+        if self.config.VECTOR_BACKEND == "local":
+            return STORAGE_LOCAL
+        if self._fixed_namespace is not None:
+            # Las ingestas nuevas guardan el texto en local y, salvo que se desactive, también en Pinecone
+            return STORAGE_HYBRID if self.config.CHUNK_TEXT_IN_METADATA else STORAGE_CHUNK_STORE
+        
+        storage = self.pointer.storage()
+        if storage is None:
+            # Puntero anterior al campo "storage": solo las versiones con solo ids tienen textos locales
+            exists = ChunkStore.exists(self.chunk_store_folder(self.namespace))
+            return STORAGE_CHUNK_STORE if exists else STORAGE_METADATA
+        return storage
+    
+    def remove_local_files(self, namespace: str):
+        """Elimina las secciones y textos locales de una versión del índice"""
+        shutil.rmtree(self.section_folder(namespace), ignore_errors=True)
+        shutil.rmtree(self.chunk_store_folder(namespace), ignore_errors=True)
+    
+    def init_local_index(self):
+        """Inicializa el índice IVF local (corpus grandes sin Pinecone)"""
+        print("🔄 Cargando índice vectorial local...")
+        
+        self.local_store = LocalIVFVectorStore.load_or_create(
+            embedding=self.embeddings,
+            folder=self.local_folder(self.namespace),
+            dimension=self.config.EMBEDDING_DIMENSIONS,
+            nlist=self.config.IVF_NLIST,
+            nprobe=self.config.IVF_NPROBE
+        )
+        
+        print(f"✅ Índice local con {len(self.local_store.index)} vectores")
     
     def init_pinecone(self):
         """Inicializa conexión con Pinecone (nueva versión)"""
         print("🔄 Conectando con Pinecone...")
         
-        # Inicializar cliente de Pinecone
-        self.pc = Pinecone(api_key=self.config.PINECONE_API_KEY)
+        # Inicializar cliente de Pinecone (compartido por el proceso)
+        self.pc = get_pinecone_client(self.config.PINECONE_API_KEY)
         
         # Verificar si el índice existe
         existing_indexes = [index.name for index in self.pc.list_indexes()]
@@ -32,7 +123,7 @@ class VectorStoreManager:
             # Crear índice con configuración serverless (gratis)
             self.pc.create_index(
                 name=self.config.INDEX_NAME,
-                dimension=1536,  # Dimensión para text-embedding-3-small
+                dimension=self.config.EMBEDDING_DIMENSIONS,
                 metric="cosine",
                 spec=ServerlessSpec(
                     cloud="aws",
@@ -46,10 +137,25 @@ class VectorStoreManager:
             print(f"✅ Índice '{self.config.INDEX_NAME}' creado")
         else:
             print(f"✅ Índice '{self.config.INDEX_NAME}' ya existe")
+            
+            # Un índice con otra dimensión no puede recibir estos embeddings
+            index_dimension = self.pc.describe_index(self.config.INDEX_NAME).dimension
+            if index_dimension != self.config.EMBEDDING_DIMENSIONS:
+                raise ValueError(
+                    f"El índice '{self.config.INDEX_NAME}' tiene dimensión {index_dimension} "
+                    f"pero EMBEDDING_DIMENSIONS={self.config.EMBEDDING_DIMENSIONS}. "
+                    f"Ejecuta migrate_dimensions.py o ajusta EMBEDDING_DIMENSIONS."
+                )
         
         # Conectar al índice
         self.index = self.pc.Index(self.config.INDEX_NAME)
+        # La versión activa se guarda en el índice para que la vean la app y la ingesta
+        self.pointer = PineconeIndexPointer(
+            self.index, self.config.EMBEDDING_DIMENSIONS, self.config.ACTIVE_INDEX_PATH,
+            refresh_seconds=self.config.ACTIVE_INDEX_REFRESH
+        )
     
+    @profiled("indexado.almacenar", sample=1.0, snapshot=True)
     def store_documents(self, documents: List[Document]) -> bool:
         """Almacena documentos en la base vectorial"""
         if not documents:
@@ -57,16 +163,18 @@ class VectorStoreManager:
             return False
         
         try:
-            print(f"🔄 Almacenando {len(documents)} documentos en Pinecone...")
-            
-            # Crear vector store desde documentos
-            vector_store = PineconeVectorStore.from_documents(
-                documents=documents,
-                embedding=self.embeddings,
-                index_name=self.config.INDEX_NAME
-            )
+            if self.config.VECTOR_BACKEND == "local":
+                print(f"🔄 Almacenando {len(documents)} documentos en el índice local...")
+                self.local_store.add_documents(documents)
+                self.local_store.save()
+            else:
+                print(f"🔄 Almacenando {len(documents)} documentos en Pinecone...")
+                
+                # Reutiliza la conexión al índice ya abierta
+                self.get_vector_store().add_documents(documents)
             
             print(f"✅ {len(documents)} documentos almacenados correctamente")
+            self.build_section_index(documents)
             return True
         
         except Exception as e:
@@ -75,30 +183,156 @@ class VectorStoreManager:
     
     def get_vector_store(self):
         """Retorna el vector store para búsquedas"""
-        return PineconeVectorStore(
-            index_name=self.config.INDEX_NAME,
-            embedding=self.embeddings
+        namespace = self.namespace
+        if namespace != self._store_namespace:
+            # Cambio de versión activa (blue/green): las consultas siguientes usan la nueva
+            print(f"🔀 Versión del índice cambiada: '{self._store_namespace}' → '{namespace}'")
+            self._vector_store = None
+            self._section_index = None
+            self._section_index_loaded = False
+            self._store_namespace = namespace
+            if self.config.VECTOR_BACKEND == "local" and not self.replaying:
+                self.init_local_index()
+        
+        if self._vector_store is None:
+            if self.replaying:
+                vector_store = None
+            elif self.config.VECTOR_BACKEND == "local":
+                vector_store = self.local_store
+            else:
+                storage = self.storage_format()
+                folder = self.chunk_store_folder(namespace)
+                # Con los textos locales (máquina de ingesta, o carpeta desplegada) Pinecone solo
+                # devuelve ids; sin ellos, el texto sale de la metadata de Pinecone
+                chunk_store = None
+                if storage != STORAGE_METADATA and (self._fixed_namespace is not None or ChunkStore.exists(folder)):
+                    chunk_store = ChunkStore(folder)
+                if chunk_store is None and storage == STORAGE_CHUNK_STORE:
+                    # Sin los textos locales cada búsqueda devolvería cero documentos
+                    raise RuntimeError(
+                        f"La versión '{namespace}' guarda solo ids en Pinecone y falta {folder} con sus textos; "
+                        f"despliega esa carpeta con la app o vuelve a ejecutar process_and_store.py "
+                        f"con CHUNK_TEXT_IN_METADATA=1"
+                    )
+                vector_store = PineconeIdVectorStore(
+                    index=self.index,
+                    embedding=self.embeddings,
+                    chunk_store=chunk_store,
+                    namespace=namespace or None,
+                    text_in_metadata=storage != STORAGE_CHUNK_STORE,
+                    request_timeout=self.config.SEARCH_TIMEOUT  # presupuesto de la etapa de búsqueda
+                )
+            
+            if self.cassette:
+                index_label = f"{self.config.INDEX_NAME}:{namespace}" if namespace else self.config.INDEX_NAME
+                vector_store = CassetteVectorStore(
+                    vector_store, self.cassette, index_label, self.embeddings
+                )
+            self._vector_store = vector_store
+        
+        return self._vector_store
+    
+    @profiled("indexado.secciones", sample=0)
+    def build_section_index(self, documents: List[Document]):
+        """Calcula y guarda los embeddings de secciones y documentos de la versión en uso"""
+        print("🔄 Calculando embeddings de secciones...")
+        section_index = SectionIndex.build(
+            documents,
+            self.embeddings,
+            self.config.SECTION_CACHE_FOLDER,
+            cache_key=f"{self.config.EMBEDDING_MODEL}-{self.config.EMBEDDING_DIMENSIONS}"
         )
+        
+        if section_index is None:
+            print("⚠️  Los documentos no tienen secciones; se usará la búsqueda directa")
+            return
+        
+        section_index.save(self.section_folder(self.namespace))
+        self._section_index = section_index
+        self._section_index_loaded = True
+        print(f"✅ {len(section_index)} secciones de {len(section_index.documents)} documentos indexadas")
+    
+    def get_section_index(self):
+        """Índice de secciones de la versión en uso (None si no existe)"""
+        self.get_vector_store()  # detecta cambios de versión
+        if not self._section_index_loaded:
+            self._section_index = SectionIndex.load(self.section_folder(self.namespace), self.config.EMBEDDING_DIMENSIONS)
+            self._section_index_loaded = True
+        return self._section_index
     
     def search_similar_documents(self, query: str, k: int = 4) -> List[Document]:
         """Busca documentos similares a la consulta"""
         try:
-            vector_store = self.get_vector_store()
-            results = vector_store.similarity_search(query, k=k)
-            return results
+            return [doc for doc, _ in self.search_with_scores(query, k=k)]
         except Exception as e:
             print(f"❌ Error en búsqueda: {e}")
             return []
     
+    def search_with_scores(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """Busca documentos similares con su similitud coseno (los errores se propagan)"""
+        return self.search_by_vector(self.embed_query(query), k=k)
+    
+    @profiled("consulta.embedding")
+    def embed_query(self, query: str) -> List[float]:
+        """Embedding de la consulta (etapa separada para poder limitar su tiempo)"""
+        return self.query_embeddings.embed_query(query)
+    
+    @profiled("consulta.busqueda")
+    def search_by_vector(self, query_vector: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        """Busca por un embedding ya calculado, en dos etapas si hay índice de secciones"""
+        vector_store = self.get_vector_store()
+        section_index = self.get_section_index() if self.config.HIERARCHICAL_RETRIEVAL else None
+        
+        # Con pocas secciones la búsqueda directa ya recorre un subconjunto pequeño
+        if section_index is None or len(section_index) <= self.config.RETRIEVAL_TOP_SECTIONS:
+            return vector_store.similarity_search_by_vector_with_score(query_vector, k=k)
+        
+        # Etapa 1: documentos y secciones (en memoria); etapa 2: solo sus chunks
+        section_ids = section_index.select(
+            query_vector, self.config.RETRIEVAL_TOP_DOCUMENTS, self.config.RETRIEVAL_TOP_SECTIONS
+        )
+        return vector_store.similarity_search_by_vector_with_score(
+            query_vector, k=k, filter={"section_id": {"$in": section_ids}}
+        )
+    
+    def _fetch_index_stats(self) -> dict:
+        namespace = self.namespace
+        
+        if self.config.VECTOR_BACKEND == "local":
+            self.get_vector_store()
+            return {
+                "total_vectors": len(self.local_store.index),
+                "index_total_vectors": len(self.local_store.index),
+                "dimension": self.config.EMBEDDING_DIMENSIONS,
+                "namespace": namespace,
+                "namespaces": {}
+            }
+        
+        stats = self.index.describe_index_stats()
+        namespaces = {
+            name: {"vector_count": summary.get("vector_count", 0)}
+            for name, summary in (stats.get("namespaces") or {}).items()
+            if name != CONTROL_NAMESPACE
+        }
+        # total_vectors cuenta solo la versión servida; las anteriores se conservan para rollback
+        return {
+            "total_vectors": namespaces.get(namespace, {}).get("vector_count", 0),
+            "index_total_vectors": stats.get("total_vector_count", 0),
+            "dimension": stats.get("dimension", 0),
+            "namespace": namespace,
+            "namespaces": namespaces
+        }
+    
     def get_index_stats(self) -> dict:
         """Obtiene estadísticas del índice"""
         try:
-            stats = self.index.describe_index_stats()
-            return {
-                "total_vectors": stats.get("total_vector_count", 0),
-                "dimension": stats.get("dimension", 0),
-                "namespaces": stats.get("namespaces", {})
-            }
+            if self.cassette:
+                request = {"index": self.config.INDEX_NAME}
+                if self.namespace:
+                    request["namespace"] = self.namespace
+                return self.cassette.call("index_stats", request, self._fetch_index_stats)
+            
+            return self._fetch_index_stats()
         except Exception as e:
             print(f"❌ Error obteniendo estadísticas: {e}")
             return {"error": str(e)}
@@ -106,7 +340,17 @@ class VectorStoreManager:
     def clear_index(self):
         """Limpia todos los vectores del índice"""
         try:
-            self.index.delete(delete_all=True)
+            self.remove_local_files(self.namespace)
+            self._vector_store = None
+            self._section_index = None
+            self._section_index_loaded = False
+            
+            if self.config.VECTOR_BACKEND == "local":
+                self.local_store.clear()
+                print("✅ Índice local limpiado")
+                return True
+            
+            self.index.delete(delete_all=True, namespace=self.namespace or None)
             print("✅ Índice limpiado")
             return True
         except Exception as e:
@@ -116,9 +360,93 @@ class VectorStoreManager:
     def delete_index(self):
         """Elimina el índice completamente"""
         try:
+            shutil.rmtree(self.config.SECTION_INDEX_FOLDER, ignore_errors=True)
+            shutil.rmtree(self.config.CHUNK_STORE_FOLDER, ignore_errors=True)
+            
+            if self.config.VECTOR_BACKEND == "local":
+                self.local_store.clear()
+                shutil.rmtree(self.config.LOCAL_INDEX_FOLDER, ignore_errors=True)
+                print(f"✅ Índice local '{self.config.LOCAL_INDEX_FOLDER}' eliminado")
+                return True
+            
             self.pc.delete_index(self.config.INDEX_NAME)
             print(f"✅ Índice '{self.config.INDEX_NAME}' eliminado")
             return True
         except Exception as e:
             print(f"❌ Error eliminando índice: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    def wait_for_vector_count(self, expected: int, timeout: float) -> int:
+        """Espera a que la versión en uso tenga expected vectores (Pinecone actualiza las estadísticas con retraso)"""
+        deadline = time.monotonic() + timeout
+        
+        while True:
+            count = self._fetch_index_stats()["total_vectors"]
+            if count >= expected or time.monotonic() >= deadline:
+                return count
+            time.sleep(2)
+    
+    def delete_namespace(self, namespace: str) -> bool:
+        """Elimina una versión retirada (o a medio escribir) del índice"""
+        if not namespace:
+            # El namespace por defecto (datos anteriores a las versiones) no se borra automáticamente
+            print("⚠️  La versión por defecto no se elimina automáticamente")
+            return False
+        
+        try:
+            if self.config.VECTOR_BACKEND == "local":
+                LocalIVFVectorStore.load_or_create(
+                    embedding=self.embeddings,
+                    folder=self.local_folder(namespace),
+                    dimension=self.config.EMBEDDING_DIMENSIONS
+                ).clear()
+            else:
+                self.index.delete(delete_all=True, namespace=namespace or None)
+            
+            print(f"🗑️ Versión '{namespace or 'por defecto'}' eliminada")
+            return True
+        except Exception as e:
+            print(f"❌ Error eliminando la versión '{namespace}': {e}")
+            return False
+        finally:
+            # Los archivos locales se borran aunque el namespace no llegara a existir en Pinecone
+            self.remove_local_files(namespace)
+    
+    def migrate_from_index(self, source_index_name: str, batch_size: int = 100) -> int:
+        """Copia los vectores de otro índice recortándolos a la dimensión configurada"""
+        # Los embeddings de text-embedding-3 se pueden recortar y renormalizar
+        # sin volver a llamar a OpenAI, así que no hace falta re-procesar los PDFs
+        target_dimension = self.config.EMBEDDING_DIMENSIONS
+        source_index = self.pc.Index(source_index_name)
+        source_dimension = self.pc.describe_index(source_index_name).dimension
+        
+        if source_dimension < target_dimension:
+            print(f"❌ No se puede ampliar de {source_dimension} a {target_dimension} dimensiones")
+            return 0
+        
+        print(f"🔄 Migrando '{source_index_name}' ({source_dimension}) → "
+              f"'{self.config.INDEX_NAME}' ({target_dimension})...")
+        
+        migrated = 0
+        namespaces = source_index.describe_index_stats().get("namespaces", {}) or {"": {}}
+        
+        for namespace in namespaces:
+            for ids in source_index.list(namespace=namespace, limit=batch_size):
+                fetched = source_index.fetch(ids=ids, namespace=namespace)
+                vectors = []
+                
+                for vector_id, vector in fetched.vectors.items():
+                    values = vector.values[:target_dimension]
+                    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+                    vectors.append({
+                        "id": vector_id,
+                        "values": [v / norm for v in values],
+                        "metadata": vector.metadata or {}
+                    })
+                
+                if vectors:
+                    self.index.upsert(vectors=vectors, namespace=namespace)
+                    migrated += len(vectors)
+        
+        print(f"✅ {migrated} vectores migrados. El índice '{source_index_name}' se conserva para rollback")
+        return migrated